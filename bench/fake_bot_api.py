@@ -0,0 +1,83 @@
+"""Local stand-in for the Telegram Bot API.
+
+Answers every method the bot uses with a plausible result, optionally after
+an artificial delay, and counts calls per method. Point the bot at it with
+`build_application(base_url=server.base_url)`.
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._runner = None
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self._result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, params, **fields):
+        chat_id = params.get('chat_id', '0')
+        chat_id = int(chat_id) if chat_id.lstrip('-').isdigit() else 0
+        message = {
+            "message_id": int(params.get('message_id') or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        message.update(fields)
+        return message
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'sendMessage':
+            return self._message(params, text=params.get('text', ''))
+        if method == 'sendPhoto':
+            file_id = f"photo-{next(self._file_ids)}"
+            photo = [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 720}]
+            return self._message(params, photo=photo, caption=params.get('caption', ''))
+        if method in ('editMessageCaption', 'editMessageReplyMarkup'):
+            return self._message(params)
+        if method == 'getChatMember':
+            user = {"id": int(params.get('user_id', 0)), "is_bot": False, "first_name": "Member"}
+            return {"status": "member", "user": user}
+        if method == 'getChatAdministrators':
+            owner = {"id": 1, "is_bot": False, "first_name": "Owner"}
+            return [{"status": "creator", "user": owner, "is_anonymous": False}]
+        if method == 'getChat':
+            return {"id": int(params.get('chat_id', 0)), "type": "supergroup", "permissions": {"can_send_messages": True}}
+        return True
@@ -0,0 +1,315 @@
+"""Load-test the bot offline against a fake Bot API.
+
+Runs the real Application from main.build_application() against a local
+stand-in for api.telegram.org and a throwaway database, feeds it synthetic
+update streams at a fixed rate and reports per-scenario throughput, latency
+(from enqueueing an update until all of its handlers have finished) and
+database growth. Each run is saved as JSON under bench/results/ and compared
+with the previous one.
+
+    python -m bench.run
+    python -m bench.run --rate 2000 --count 20000 --scenario vote_storm
+    python -m bench.run --api-latency 0.05 --compare bench/results/baseline.json
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+
+from bench import scenarios
+from bench.fake_bot_api import FakeBotAPI
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+CHANNEL_ID = -1001000000000
+
+# Metrics where a bigger number is worse
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "db_growth_bytes")
+
+
+class LatencyTracker:
+    """Records when each update was queued and when its last handler group finished."""
+
+    def __init__(self):
+        self.enqueued = {}
+        self.latencies = []
+        self.expected = 0
+        self.done = asyncio.Event()
+
+    def reset(self, expected):
+        self.enqueued.clear()
+        self.latencies = []
+        self.expected = expected
+        self.done.clear()
+
+    async def finished(self, update, context):
+        started = self.enqueued.pop(update.update_id, None)
+        if started is None:
+            return
+        self.latencies.append(time.perf_counter() - started)
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def db_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+async def feed(application, updates, rate, tracker):
+    """Put updates on the application's queue at `rate` per second."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for i, update in enumerate(updates):
+        delay = started + i / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tracker.enqueued[update.update_id] = time.perf_counter()
+        await application.update_queue.put(update)
+
+
+async def seed_polls(main, count, rng):
+    """Create polls directly in storage; returns (poll_id, channel message_id, option count) and titles."""
+    titles = scenarios.poll_titles(count, rng)
+    polls = []
+    for i, title in enumerate(titles):
+        poll_id = main.generate_poll_id()
+        options = [f"Option {n}" for n in range(rng.randint(2, 5))]
+        await main.storage.create_poll(poll_id, 1, "bench", title, options, "https://example.com/poll.jpg")
+        main.tally_cache.add_poll(poll_id, "bench", title, options, "https://example.com/poll.jpg")
+        polls.append((poll_id, 1000 + i, len(options)))
+    return polls, titles
+
+
+async def run_scenario(name, main, application, api, tracker, args, context):
+    from telegram import Update
+
+    update_ids = context["update_ids"]
+    raw = scenarios.build(name, update_ids, args.count, args.seed, context["polls"], context["titles"],
+                          CHANNEL_ID, context["encode_vote"])
+    updates = [Update.de_json(data, application.bot) for data in raw]
+    tracker.reset(len(updates))
+    api.calls.clear()
+    errors_before = context["errors"][0]
+    db_before = db_size(context["db_path"])
+
+    started = time.perf_counter()
+    await feed(application, updates, args.rate, tracker)
+    try:
+        await asyncio.wait_for(tracker.done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        logging.getLogger(__name__).warning(f"{name}: only {len(tracker.latencies)}/{len(updates)} updates finished")
+    elapsed = time.perf_counter() - started
+    await main.tally_cache.flush()
+    db_after = db_size(context["db_path"])
+
+    latencies = tracker.latencies
+    return {
+        "updates": len(updates),
+        "processed": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+        "errors": context["errors"][0] - errors_before,
+        "db_growth_bytes": db_after - db_before,
+        "outbox_depth": main.outbox.depth,
+        "api_calls": dict(api.calls),
+    }
+
+
+async def run(args, db_path):
+    # Imported here: config reads the environment set up by main()
+    import main
+    from callbacks import VOTE, encode_callback
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from telegram.warnings import PTBUserWarning
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        warnings.filterwarnings("ignore", category=PTBUserWarning)
+
+    api = FakeBotAPI(latency=args.api_latency)
+    await api.start()
+    application = main.build_application(token="123456:BENCH", base_url=api.base_url)
+
+    tracker = LatencyTracker()
+    # The last handler group sees every update once all other groups are done
+    application.add_handler(TypeHandler(Update, tracker.finished), group=1000)
+    errors = [0]
+
+    async def count_error(update, context):
+        errors[0] += 1
+
+    application.add_error_handler(count_error)
+
+    results = {}
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    await main.warm_up_task
+    print_startup(main.startup_timings)
+    try:
+        rng = random.Random(args.seed)
+        polls, titles = await seed_polls(main, args.polls, rng)
+        context = {
+            "update_ids": itertools.count(1),
+            "polls": polls,
+            "titles": titles,
+            "encode_vote": lambda poll_id, option: encode_callback(VOTE, poll_id, str(option)),
+            "errors": errors,
+            "db_path": db_path,
+        }
+        for name in args.scenario or scenarios.SCENARIOS:
+            results[name] = await run_scenario(name, main, application, api, tracker, args, context)
+            print_scenario(name, results[name])
+    finally:
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+        await api.stop()
+    return results, dict(main.startup_timings)
+
+
+def print_scenario(name, result):
+    print(f"{name:<14} {result['processed']:>7}/{result['updates']:<7} {result['throughput']:>9.1f}/s "
+          f"p50 {result['p50_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  "
+          f"db +{result['db_growth_bytes'] / 1024:.0f}KiB  errors {result['errors']}")
+
+
+def print_startup(timings):
+    print("startup        " + "  ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in timings.items()))
+
+
+def compare(current, previous, threshold):
+    """Print changes against a previous run; returns the list of regressions."""
+    regressions = []
+    print(f"\nCompared with {previous['started_at']} ({previous.get('commit') or 'unknown commit'}):")
+    for name, result in current["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if not before:
+            continue
+        changes = []
+        for metric in ("throughput",) + LOWER_IS_BETTER:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            changes.append(f"{metric} {change:+.1f}%{' !' if worse else ''}")
+            if worse:
+                regressions.append(f"{name} {metric}: {old} -> {new}")
+        print(f"  {name:<14} " + ", ".join(changes))
+    changes = []
+    for phase, seconds in current.get("startup", {}).items():
+        old = previous.get("startup", {}).get(phase)
+        if old:
+            changes.append(f"{phase} {(seconds - old) / old * 100:+.1f}%")
+    if changes:
+        # Reported but not gated: cold-start timings are too noisy for a threshold
+        print(f"  {'startup':<14} " + ", ".join(changes))
+    return regressions
+
+
+def latest_result(exclude=None):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bot against a fake Bot API.")
+    parser.add_argument("--scenario", action="append", choices=scenarios.SCENARIOS,
+                        help="Scenario to run; repeat for several (default: all)")
+    parser.add_argument("--count", type=int, default=5000, help="Updates per scenario")
+    parser.add_argument("--rate", type=float, default=1000, help="Updates per second fed to the bot")
+    parser.add_argument("--polls", type=int, default=500, help="Polls seeded before the run")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds the fake API waits before answering")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for a scenario to drain")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="Results file to compare with (default: the latest in bench/results)")
+    parser.add_argument("--threshold", type=float, default=10, help="Percent change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    parser.add_argument("--no-save", action="store_true", help="Don't write results to bench/results")
+    parser.add_argument("--verbose", action="store_true", help="Keep the bot's INFO logging")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ.update({
+        "TOKEN": "123456:BENCH",
+        "ADMIN_ID": "1",
+        "CHANNEL_ID": str(CHANNEL_ID),
+        "BOT_USERNAME": "bench_bot",
+        "WELCOME_IMAGE_URL": "https://example.com/welcome.jpg",
+        "DB_PATH": db_path,
+        "BOT_MODE": "polling",
+    })
+    for name in ("METRICS_PORT", "PORT"):
+        os.environ.pop(name, None)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    try:
+        results, startup = asyncio.run(run(args, db_path))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "started_at": started_at,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {"count": args.count, "rate": args.rate, "polls": args.polls,
+                     "api_latency": args.api_latency, "seed": args.seed},
+        "startup": {phase: round(seconds, 4) for phase, seconds in startup.items()},
+        "scenarios": results,
+    }
+    saved = None
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        saved = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+        with open(saved, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {saved}")
+
+    previous_path = args.compare or latest_result(exclude=saved)
+    if previous_path:
+        with open(previous_path) as f:
+            previous = json.load(f)
+        if previous.get("settings") != report["settings"]:
+            print(f"Note: {previous_path} was run with different settings: {previous.get('settings')}")
+        regressions = compare(report, previous, args.threshold)
+        if regressions and args.fail_on_regression:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Synthetic update streams, as Bot API JSON dicts.
+
+Each scenario yields `count` updates; `update_ids` is shared so ids stay
+unique across scenarios within a run.
+"""
+import random
+import time
+
+WORDS = ("pizza", "pasta", "coffee", "tea", "football", "music", "movie", "travel", "summer", "winter",
+         "python", "election", "weekend", "holiday", "favourite", "best", "color", "game", "book", "city")
+
+GROUPS = [-1002000000000 - i for i in range(20)]
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def _message(message_id, chat_id, user_id, chat_type="supergroup", **fields):
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": chat_type},
+        "from": _user(user_id),
+    }
+    message.update(fields)
+    return message
+
+
+def poll_titles(count, rng):
+    return [f"{' '.join(rng.sample(WORDS, 3)).capitalize()} {i}" for i in range(count)]
+
+
+def vote_storm(update_ids, count, rng, polls, channel_id, encode_vote, hot_polls=10, duplicate_rate=0.05):
+    """Votes from mostly new users on a few popular channel posts."""
+    hot = polls[:hot_polls]
+    next_user = 10_000_000
+    voters = []
+    for _ in range(count):
+        poll_id, message_id, option_count = rng.choice(hot)
+        if voters and rng.random() < duplicate_rate:
+            user_id = rng.choice(voters)
+        else:
+            user_id = next_user
+            next_user += 1
+            voters.append(user_id)
+        update_id = next(update_ids)
+        yield {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": _user(user_id),
+                "chat_instance": str(channel_id),
+                "data": encode_vote(poll_id, rng.randrange(option_count)),
+                "message": _message(message_id, channel_id, 100000, chat_type="channel", caption="Poll"),
+            },
+        }
+
+
+def join_raid(update_ids, count, rng, max_batch=3):
+    """Users joining a handful of groups in quick succession."""
+    next_user = 20_000_000
+    for _ in range(count):
+        members = []
+        for _ in range(rng.randint(1, max_batch)):
+            members.append(_user(next_user))
+            next_user += 1
+        update_id = next(update_ids)
+        chat_id = rng.choice(GROUPS)
+        yield {"update_id": update_id, "message": _message(update_id, chat_id, members[0]["id"], new_chat_members=members)}
+
+
+def inline_typing(update_ids, count, rng, titles):
+    """Users typing poll titles into inline mode one character at a time."""
+    next_user = 30_000_000
+    produced = 0
+    while produced < count:
+        user_id = next_user
+        next_user += 1
+        title = rng.choice(titles).lower()
+        for end in range(1, len(title) + 1):
+            if produced == count:
+                return
+            update_id = next(update_ids)
+            yield {
+                "update_id": update_id,
+                "inline_query": {"id": str(update_id), "from": _user(user_id), "query": title[:end], "offset": ""},
+            }
+            produced += 1
+
+
+def flood(update_ids, count, rng, spammers=50):
+    """A few users per group sending messages as fast as they can."""
+    users = [(40_000_000 + i, GROUPS[i % len(GROUPS)]) for i in range(spammers)]
+    for _ in range(count):
+        user_id, chat_id = rng.choice(users)
+        update_id = next(update_ids)
+        yield {"update_id": update_id, "message": _message(update_id, chat_id, user_id, text="spam " * rng.randint(1, 5))}
+
+
+SCENARIOS = ("vote_storm", "join_raid", "inline_typing", "flood")
+
+
+def build(name, update_ids, count, seed, polls, titles, channel_id, encode_vote):
+    rng = random.Random(seed)
+    if name == "vote_storm":
+        return list(vote_storm(update_ids, count, rng, polls, channel_id, encode_vote))
+    if name == "join_raid":
+        return list(join_raid(update_ids, count, rng))
+    if name == "inline_typing":
+        return list(inline_typing(update_ids, count, rng, titles))
+    if name == "flood":
+        return list(flood(update_ids, count, rng))
+    raise ValueError(f"Unknown scenario {name!r}")
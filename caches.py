@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class AsyncTTLCache:
+    """Small LRU cache for values fetched by coroutines.
+
+    Entries expire after `ttl` seconds, or `negative_ttl` for falsy values.
+    Concurrent misses on the same key share a single fetch; failed fetches
+    are not cached.
+    """
+
+    def __init__(self, ttl, negative_ttl=None, max_entries=10000):
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._pending = {}
+
+    async def get(self, key, fetch):
+        """Return the cached value for key, calling `await fetch()` on a miss."""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, fetch))
+            self._pending[key] = future
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key, fetch):
+        try:
+            value = await fetch()
+            self.set(key, value)
+            return value
+        finally:
+            self._pending.pop(key, None)
+
+    def set(self, key, value):
+        ttl = self.ttl if value else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AdminCache:
+    """Per-chat set of administrator ids."""
+
+    def __init__(self, ttl=300):
+        self._cache = AsyncTTLCache(ttl)
+
+    async def get_admin_ids(self, bot, chat_id):
+        async def fetch():
+            admins = await bot.get_chat_administrators(chat_id)
+            return frozenset(admin.user.id for admin in admins)
+        return await self._cache.get(chat_id, fetch)
+
+    async def is_admin(self, bot, chat_id, user_id):
+        return user_id in await self.get_admin_ids(bot, chat_id)
+
+    def invalidate(self, chat_id):
+        self._cache.invalidate(chat_id)
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+
+class MembershipCache:
+    """Whether users belong to a chat, with a shorter TTL for non-members
+    so that users who just joined aren't turned away for long."""
+
+    MEMBER_STATUSES = ['member', 'creator', 'administrator']
+
+    def __init__(self, ttl=600, negative_ttl=30):
+        self._cache = AsyncTTLCache(ttl, negative_ttl, max_entries=50000)
+
+    async def is_member(self, bot, chat_id, user_id):
+        async def fetch():
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            return member.status in self.MEMBER_STATUSES
+        return await self._cache.get((chat_id, user_id), fetch)
+
+    def update(self, chat_id, user_id, status):
+        self._cache.set((chat_id, user_id), status in self.MEMBER_STATUSES)
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
@@ -0,0 +1,79 @@
+"""Compact callback_data for poll buttons.
+
+Telegram limits callback_data to 64 bytes. Version 1 packs a button into
+`1<action><poll ref>[.<arg>]`, e.g. `1vq3Rz0Yb8KpXa.2` for "vote for option 2".
+Poll ids created by `generate_poll_id()` are 12 base64url characters and are
+used as the ref directly; legacy UUID poll ids are shortened to `~` plus the
+base64url of their 16 bytes. Legacy `vote_<uuid>_<i>`, `results_<uuid>` and
+`react_<uuid>_<name>` data from old posts is still decoded.
+"""
+import base64
+import re
+import secrets
+import uuid
+from collections import namedtuple
+
+PollCallback = namedtuple('PollCallback', ['action', 'poll_id', 'arg'])
+
+VOTE = 'vote'
+RESULTS = 'results'
+REACT = 'react'
+
+VERSION = '1'
+_ACTION_CODES = {VOTE: 'v', RESULTS: 'r', REACT: 'x'}
+_CODE_ACTIONS = {code: action for action, code in _ACTION_CODES.items()}
+_LEGACY_UUID_PREFIX = '~'
+
+# Matches every callback_data handled by decode_callback()
+CALLBACK_PATTERN = re.compile(r'^(1[vrx]|vote_|results_|react_)')
+
+
+def generate_poll_id():
+    """Random 72-bit poll id as 12 URL-safe characters (also valid in /start deep links)."""
+    return base64.urlsafe_b64encode(secrets.token_bytes(9)).decode()
+
+
+def _encode_ref(poll_id):
+    try:
+        legacy = uuid.UUID(poll_id)
+    except ValueError:
+        legacy = None
+    if legacy is not None and len(poll_id) == 36:
+        return _LEGACY_UUID_PREFIX + base64.urlsafe_b64encode(legacy.bytes).decode().rstrip('=')
+    if '.' in poll_id or poll_id.startswith(_LEGACY_UUID_PREFIX):
+        raise ValueError(f"Poll id {poll_id!r} can't be encoded in callback data")
+    return poll_id
+
+
+def _decode_ref(ref):
+    if ref.startswith(_LEGACY_UUID_PREFIX):
+        return str(uuid.UUID(bytes=base64.urlsafe_b64decode(ref[1:] + '==')))
+    return ref
+
+
+def encode_callback(action, poll_id, arg=None):
+    data = VERSION + _ACTION_CODES[action] + _encode_ref(poll_id)
+    if arg is not None:
+        data += f".{arg}"
+    if len(data.encode()) > 64:
+        raise ValueError(f"Callback data {data!r} exceeds 64 bytes")
+    return data
+
+
+def decode_callback(data):
+    """Parse poll button data into a PollCallback, or return None if it isn't one."""
+    try:
+        if data.startswith(VERSION) and data[1:2] in _CODE_ACTIONS:
+            ref, _, arg = data[2:].partition('.')
+            return PollCallback(_CODE_ACTIONS[data[1]], _decode_ref(ref), arg or None)
+        # Legacy format from posts made before the compact encoding
+        action, _, rest = data.partition('_')
+        if action == RESULTS and rest:
+            return PollCallback(RESULTS, rest, None)
+        if action in (VOTE, REACT):
+            poll_id, _, arg = rest.rpartition('_')
+            if poll_id and arg:
+                return PollCallback(action, poll_id, arg)
+    except ValueError:
+        pass
+    return None
@@ -1,10 +1,82 @@
 import os
 
+# Required; main() refuses to start without them (importing this module never fails)
 TOKEN = os.getenv("TOKEN")
-ADMIN_ID = int(os.getenv("ADMIN_ID"))
-CHANNEL_ID = int(os.getenv("CHANNEL_ID"))
+ADMIN_ID = int(os.getenv("ADMIN_ID") or 0)
+CHANNEL_ID = int(os.getenv("CHANNEL_ID") or 0)
 BOT_USERNAME = os.getenv("BOT_USERNAME")
 WELCOME_IMAGE_URL = os.getenv("WELCOME_IMAGE_URL")
 
-if not all([TOKEN, ADMIN_ID, CHANNEL_ID, BOT_USERNAME, WELCOME_IMAGE_URL]):
-    raise EnvironmentError("One or more environment variables are missing. Please set TOKEN, ADMIN_ID, CHANNEL_ID, BOT_USERNAME, and WELCOME_IMAGE_URL.")
+REQUIRED_SETTINGS = ("TOKEN", "ADMIN_ID", "CHANNEL_ID", "BOT_USERNAME", "WELCOME_IMAGE_URL")
+
+
+def missing_settings():
+    """Names of the required environment variables that aren't set."""
+    return [name for name in REQUIRED_SETTINGS if not globals()[name]]
+
+# Vote write-behind: pending votes are flushed to SQLite every
+# VOTE_FLUSH_INTERVAL seconds or as soon as VOTE_FLUSH_SIZE are queued.
+VOTE_FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", "2"))
+VOTE_FLUSH_SIZE = int(os.getenv("VOTE_FLUSH_SIZE", "100"))
+
+DB_PATH = os.getenv("DB_PATH", "bot_data.db")
+
+# Minimum seconds between two live-results edits of the same channel post
+RESULTS_EDIT_INTERVAL = float(os.getenv("RESULTS_EDIT_INTERVAL", "3"))
+
+# Update delivery. With WEBHOOK_URL set the bot registers a webhook and serves
+# it from a built-in aiohttp server; BOT_MODE=polling forces long polling.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8080"))
+# Webhook mode serves /healthz and /metrics on PORT. Polling mode serves them on
+# METRICS_PORT, or on PORT when the host sets it (e.g. for Render's health check)
+METRICS_PORT = int(os.getenv("METRICS_PORT") or os.getenv("PORT") or 0) or None
+BOT_MODE = os.getenv("BOT_MODE", "webhook" if WEBHOOK_URL else "polling")
+
+# Default anti-flood limits: more than FLOOD_THRESHOLD messages within
+# FLOOD_TIME_WINDOW seconds gets a user muted. Groups can override with /setflood.
+FLOOD_THRESHOLD = int(os.getenv("FLOOD_THRESHOLD", "5"))
+FLOOD_TIME_WINDOW = int(os.getenv("FLOOD_TIME_WINDOW", "5"))
+
+# Seconds a chat's administrator list is cached for admin-only commands
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "300"))
+
+# Seconds a channel membership check is cached for members / non-members
+MEMBERSHIP_CACHE_TTL = int(os.getenv("MEMBERSHIP_CACHE_TTL", "600"))
+MEMBERSHIP_NEGATIVE_TTL = int(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "30"))
+
+# Expired mutes are lifted every MUTE_SWEEP_INTERVAL seconds, MUTE_SWEEP_BATCH at a time
+MUTE_SWEEP_INTERVAL = int(os.getenv("MUTE_SWEEP_INTERVAL", "30"))
+MUTE_SWEEP_BATCH = int(os.getenv("MUTE_SWEEP_BATCH", "100"))
+
+# Outgoing message limits: messages per second across all chats, the
+# minimum seconds between two messages to the same group or channel, and
+# how many low-priority messages may wait per chat before new ones are dropped
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+OUTBOX_GROUP_INTERVAL = float(os.getenv("OUTBOX_GROUP_INTERVAL", "1"))
+OUTBOX_MAX_BULK_PER_CHAT = int(os.getenv("OUTBOX_MAX_BULK_PER_CHAT", "20"))
+
+# Members joining a group within this many seconds get a single welcome message
+WELCOME_BATCH_WINDOW = float(os.getenv("WELCOME_BATCH_WINDOW", "3"))
+
+# Running several workers. STATE_URL (redis://...) holds state they share:
+# tallies, flood counters and conversations, written back every
+# STATE_SYNC_INTERVAL seconds. WORKER_PEERS lists every worker's base URL in
+# the same order on each worker, and WORKER_INDEX is this worker's position;
+# updates are forwarded to the worker that owns their chat.
+STATE_URL = os.getenv("STATE_URL")
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", "5"))
+WORKER_PEERS = [peer for peer in os.getenv("WORKER_PEERS", "").split(",") if peer.strip()]
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+
+# Poll lifecycle. New polls close after POLL_DURATION_HOURS (0 keeps them open
+# until /close). Closed polls are archived POLL_ARCHIVE_AFTER_HOURS later: the
+# final counts are kept and the raw votes deleted, ARCHIVE_BATCH per
+# transaction, by a job running every ARCHIVE_INTERVAL seconds.
+POLL_DURATION_HOURS = float(os.getenv("POLL_DURATION_HOURS", "0"))
+POLL_ARCHIVE_AFTER_HOURS = float(os.getenv("POLL_ARCHIVE_AFTER_HOURS", "24"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "600"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "5000"))
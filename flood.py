@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict, deque
+
+
+class FloodControl:
+    """Sliding-window flood detection keyed by (chat_id, user_id).
+
+    Each user keeps a ring buffer of their last `threshold + 1` message
+    times, so a check is O(1): the user is flooding when the buffer is full
+    and its oldest entry is still inside the window. Entries are kept in
+    least-recently-seen order and evicted once idle for `idle_ttl` seconds or
+    when more than `max_entries` users are tracked.
+    """
+
+    def __init__(self, threshold=5, window=5, max_entries=50000, idle_ttl=600):
+        self.default_limits = (threshold, window)
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.limits = {}
+        self._windows = OrderedDict()  # (chat_id, user_id) -> [last_seen, deque of timestamps]
+
+    def set_limits(self, chat_id, threshold, window):
+        self.limits[chat_id] = (threshold, window)
+
+    def get_limits(self, chat_id):
+        return self.limits.get(chat_id, self.default_limits)
+
+    def hit(self, chat_id, user_id, now=None):
+        """Record a message and return True if the user just exceeded the limit."""
+        if now is None:
+            now = time.monotonic()
+        threshold, window = self.get_limits(chat_id)
+        key = (chat_id, user_id)
+        entry = self._windows.get(key)
+        if entry is None or entry[1].maxlen != threshold + 1:
+            entry = [now, deque(entry[1] if entry else (), maxlen=threshold + 1)]
+            self._windows[key] = entry
+        else:
+            entry[0] = now
+        self._windows.move_to_end(key)
+        times = entry[1]
+        times.append(now)
+        self._evict(now)
+        if len(times) == times.maxlen and now - times[0] < window:
+            # Start over so the following messages don't trigger again
+            times.clear()
+            return True
+        return False
+
+    def _evict(self, now):
+        while self._windows:
+            key, (last_seen, _) = next(iter(self._windows.items()))
+            if len(self._windows) <= self.max_entries and now - last_seen < self.idle_ttl:
+                break
+            del self._windows[key]
+
+    def __len__(self):
+        return len(self._windows)
+
+
+class SharedFloodControl:
+    """Flood detection with counters in a shared state backend, so several
+    workers count the same user's messages together.
+
+    Messages are counted per fixed window of `window` seconds, which takes a
+    single round trip per message but can let up to twice the threshold
+    through across a window boundary. Limits come from `limits`, a
+    FloodControl holding the per-chat settings.
+    """
+
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = limits
+
+    async def hit(self, chat_id, user_id, now=None):
+        """Record a message and return True if the user just exceeded the limit."""
+        if now is None:
+            now = time.time()
+        threshold, window = self.limits.get_limits(chat_id)
+        bucket = int(now // window)
+        count = await self.backend.incr(f"flood:{chat_id}:{user_id}:{bucket}", ttl=window * 2)
+        return count == threshold + 1
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from functools import partial
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+EDITS = Counter('bot_results_edits_total', 'Live-results edits by outcome.', ['outcome'])
+
+
+class ResultsRefresher:
+    """Coalesces live-results edits per (chat_id, message_id).
+
+    `schedule()` only marks a message as dirty; a single task per message
+    renders the latest state at most once every `interval` seconds, skips the
+    edit if the caption and keyboard are unchanged, and waits out RetryAfter.
+    `render(poll_id, with_caption)` must return (caption, reply_markup), with
+    caption None for keyboard-only edits and reply_markup None if the poll is
+    gone. Once a message's caption has been edited, later edits keep it current.
+    Edits are made through `send(chat_id, call)` when given, e.g. an Outbox.
+    """
+
+    def __init__(self, render, interval=3.0, max_tracked=1000, send=None):
+        self.render = render
+        self.send = send
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self._tasks = {}
+        self._dirty = {}  # key -> whether the caption needs refreshing
+        self._last_sent = OrderedDict()  # key -> (monotonic time, caption, markup)
+
+    def schedule(self, bot, chat_id, message_id, poll_id, keyboard_only=False):
+        key = (chat_id, message_id)
+        self._dirty[key] = self._dirty.get(key, False) or not keyboard_only
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(bot, key, poll_id))
+
+    async def _run(self, bot, key, poll_id):
+        try:
+            while key in self._dirty:
+                last = self._last_sent.get(key)
+                if last:
+                    delay = last[0] + self.interval - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                with_caption = self._dirty.pop(key) or bool(last and last[1] is not None)
+                await self._edit(bot, key, poll_id, with_caption)
+        except Exception as e:
+            EDITS.inc(outcome='failed')
+            logger.error(f"Failed to refresh results for {key}: {e}")
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _edit(self, bot, key, poll_id, with_caption):
+        caption, reply_markup = self.render(poll_id, with_caption)
+        if reply_markup is None:
+            return
+        last = self._last_sent.get(key)
+        if last and last[1] == caption and last[2] == reply_markup:
+            EDITS.inc(outcome='skipped')
+            return
+        chat_id, message_id = key
+        while True:
+            try:
+                if caption is None:
+                    call = partial(bot.edit_message_reply_markup, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+                else:
+                    call = partial(
+                        bot.edit_message_caption,
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        caption=caption,
+                        reply_markup=reply_markup,
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                await (self.send(chat_id, call) if self.send else call())
+                EDITS.inc(outcome='sent')
+                break
+            except RetryAfter as e:
+                EDITS.inc(outcome='rate_limited')
+                logger.warning(f"Rate limited editing {key}, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+                # Render again: more votes may have arrived while we waited
+                with_caption = self._dirty.pop(key, False) or with_caption
+                caption, reply_markup = self.render(poll_id, with_caption)
+                if reply_markup is None:
+                    return
+            except BadRequest as e:
+                if 'not modified' not in str(e).lower():
+                    raise
+                EDITS.inc(outcome='not_modified')
+                break
+        self._remember(key, caption, reply_markup)
+
+    def _remember(self, key, caption, reply_markup):
+        self._last_sent[key] = (time.monotonic(), caption, reply_markup)
+        self._last_sent.move_to_end(key)
+        while len(self._last_sent) > self.max_tracked:
+            self._last_sent.popitem(last=False)
@@ -1,19 +1,45 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import functools
 import logging
-import sqlite3
-import uuid
 import re
-import time
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 import random
 
 # Make sure you have a config.py file with these variables
-from config import TOKEN, ADMIN_ID, CHANNEL_ID, BOT_USERNAME, WELCOME_IMAGE_URL
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, InputFile, InlineQueryResultArticle, InputTextMessageContent
+from config import (
+    TOKEN, ADMIN_ID, CHANNEL_ID, BOT_USERNAME, WELCOME_IMAGE_URL, DB_PATH,
+    VOTE_FLUSH_INTERVAL, VOTE_FLUSH_SIZE, RESULTS_EDIT_INTERVAL, OUTBOX_GLOBAL_RATE, OUTBOX_GROUP_INTERVAL,
+    OUTBOX_MAX_BULK_PER_CHAT,
+    FLOOD_THRESHOLD, FLOOD_TIME_WINDOW, MUTE_SWEEP_INTERVAL, MUTE_SWEEP_BATCH,
+    ADMIN_CACHE_TTL, MEMBERSHIP_CACHE_TTL, MEMBERSHIP_NEGATIVE_TTL, WELCOME_BATCH_WINDOW,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, PORT, METRICS_PORT,
+    STATE_URL, STATE_SYNC_INTERVAL, WORKER_PEERS, WORKER_INDEX,
+    POLL_DURATION_HOURS, POLL_ARCHIVE_AFTER_HOURS, ARCHIVE_INTERVAL, ARCHIVE_BATCH, missing_settings,
+)
+from callbacks import CALLBACK_PATTERN, VOTE, RESULTS, REACT, decode_callback, generate_poll_id
+from caches import AdminCache, AsyncTTLCache, MembershipCache
+from flood import FloodControl, SharedFloodControl
+from live_results import ResultsRefresher
+from media import MediaCache, is_url
+from metrics import CallbackMetric, Counter, InstrumentedRequest, instrument_handlers
+from outbox import Outbox
+from render import PollRenderer
+from state import BackendPersistence, Partitioner, create_backend
+from storage import Storage
+from tally import TallyCache
+from welcome import WelcomeBatcher
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile, InlineQueryResultArticle, InputTextMessageContent
+from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    ChatMemberHandler,
     InlineQueryHandler,
     ConversationHandler,
     ContextTypes,
@@ -32,129 +58,155 @@ POLL_TITLE, POLL_OPTIONS, POLL_IMAGE = range(3)
 # State for romantic chat conversation
 ROMANTIC_CHAT = 4
 
-# Anti-flood settings
-FLOOD_THRESHOLD = 5  # Max messages in a time interval
-FLOOD_TIME_WINDOW = 5  # Time window in seconds
-user_last_messages = {}
+# State shared between workers (flood counters, conversations); None for a single worker
+state_backend = create_backend(STATE_URL) if STATE_URL else None
+
+# Webhook workers split updates by chat. Poll traffic, including these commands and
+# buttons in groups, all goes to the worker owning CHANNEL_ID, so a single database holds every poll
+POLL_COMMANDS = ('start', 'create', 'stats', 'top', 'close')
+POLL_CALLBACKS = re.compile(f"{CALLBACK_PATTERN.pattern}|^create_poll$")
+partitioner = (
+    Partitioner(WORKER_INDEX, WORKER_PEERS, poll_chat_id=CHANNEL_ID, poll_commands=POLL_COMMANDS,
+                poll_callbacks=POLL_CALLBACKS)
+    if BOT_MODE == 'webhook' and len(WORKER_PEERS) > 1 else None
+)
 
-# --- Database Setup ---
-conn = sqlite3.connect('bot_data.db')
-c = conn.cursor()
-c.execute('''
-    CREATE TABLE IF NOT EXISTS polls (
-        poll_id TEXT PRIMARY KEY,
-        creator_id INTEGER,
-        creator_username TEXT,
-        title TEXT,
-        image_url TEXT
-    )
-''')
-c.execute('''
-    CREATE TABLE IF NOT EXISTS options (
-        poll_id TEXT,
-        option_index INTEGER,
-        option_text TEXT,
-        PRIMARY KEY (poll_id, option_index),
-        FOREIGN KEY (poll_id) REFERENCES polls(poll_id) ON DELETE CASCADE
-    )
-''')
-c.execute('''
-    CREATE TABLE IF NOT EXISTS votes (
-        poll_id TEXT,
-        voter_id INTEGER,
-        voter_username TEXT,
-        option_index INTEGER,
-        FOREIGN KEY (poll_id) REFERENCES polls(poll_id) ON DELETE CASCADE
-    )
-''')
-c.execute('''
-    CREATE TABLE IF NOT EXISTS group_settings (
-        chat_id INTEGER PRIMARY KEY,
-        welcome_message TEXT,
-        welcome_image_url TEXT
-    )
-''')
-c.execute('''
-    CREATE TABLE IF NOT EXISTS active_mutes (
-        chat_id INTEGER,
-        user_id INTEGER,
-        mute_until INTEGER,
-        PRIMARY KEY (chat_id, user_id)
-    )
-''')
-conn.commit()
+# Anti-flood tracking, per (chat, user); per-group limits are loaded on startup
+flood_control = FloodControl(FLOOD_THRESHOLD, FLOOD_TIME_WINDOW)
+shared_flood_control = SharedFloodControl(state_backend, flood_control) if state_backend else None
+FLOOD_MUTE_MINUTES = 10
 
-# --- Helper Functions ---
-def get_group_settings(chat_id):
-    c.execute("SELECT welcome_message, welcome_image_url FROM group_settings WHERE chat_id = ?", (chat_id,))
-    return c.fetchone()
-
-def update_group_settings(chat_id, welcome_message, welcome_image_url):
-    c.execute("REPLACE INTO group_settings VALUES (?, ?, ?)", (chat_id, welcome_message, welcome_image_url))
-    conn.commit()
-
-def add_mute(chat_id, user_id, duration_minutes):
-    mute_until = int(time.time()) + duration_minutes * 60
-    c.execute("REPLACE INTO active_mutes VALUES (?, ?, ?)", (chat_id, user_id, mute_until))
-    conn.commit()
-
-def remove_mute(chat_id, user_id):
-    c.execute("DELETE FROM active_mutes WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-    conn.commit()
-
-def is_user_muted(chat_id, user_id):
-    c.execute("SELECT mute_until FROM active_mutes WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
-    result = c.fetchone()
-    if result:
-        mute_until = result[0]
-        if time.time() < mute_until:
-            return True
-        else:
-            remove_mute(chat_id, user_id)
-            return False
-    return False
+# Chat administrators, refreshed after ADMIN_CACHE_TTL or on admin changes
+admin_cache = AdminCache(ADMIN_CACHE_TTL)
+
+# Channel membership for deep-link voting, kept fresh from chat member updates
+membership_cache = MembershipCache(MEMBERSHIP_CACHE_TTL, MEMBERSHIP_NEGATIVE_TTL)
 
-def generate_poll_id():
-    return str(uuid.uuid4())
+# Inline search results per (query, offset); users type in bursts
+INLINE_PAGE_SIZE = 50  # Telegram rejects inline answers with more results
+search_cache = AsyncTTLCache(ttl=30, max_entries=1000)
 
-def get_poll_data(poll_id):
-    c.execute("SELECT * FROM polls WHERE poll_id = ?", (poll_id,))
-    poll = c.fetchone()
-    if not poll:
+# --- Database Setup ---
+# The schema is migrated and tallies are loaded in on_startup, once the event loop is running
+storage = Storage(DB_PATH)
+tally_cache = TallyCache(storage, flush_size=VOTE_FLUSH_SIZE)
+
+# --- Helper Functions ---
+REACTIONS = {"like": "👍", "dislike": "👎", "heart": "❤️", "laugh": "😂"}
+
+# Rendered poll messages, reused until the poll's tally changes
+poll_renderer = PollRenderer(REACTIONS)
+
+# Every outgoing message goes through the outbox for rate limiting and retries
+outbox = Outbox(global_rate=OUTBOX_GLOBAL_RATE, group_interval=OUTBOX_GROUP_INTERVAL,
+                max_bulk_per_chat=OUTBOX_MAX_BULK_PER_CHAT)
+
+def reply(update: Update, text, urgent=True, **kwargs):
+    """Queue a reply to the update's message without waiting for it to be sent."""
+    message = update.effective_message
+    return outbox.submit(message.chat_id, functools.partial(message.reply_text, text, **kwargs), urgent=urgent)
+
+def send_later(method, chat_id, urgent=False, **kwargs):
+    """Queue a bot method call such as context.bot.send_photo for chat_id."""
+    return outbox.submit(chat_id, functools.partial(method, chat_id=chat_id, **kwargs), urgent=urgent)
+
+# Telegram file_ids of images already sent, so they aren't fetched again
+media_cache = MediaCache(storage, local_files=[WELCOME_IMAGE_URL])
+
+def cached_photo(method):
+    """Wrap a send_photo-like method to send photos by cached file_id."""
+    return functools.partial(media_cache.send_photo, method)
+
+# --- Metrics ---
+VOTES = Counter('bot_votes_total', 'Votes received, by whether they were counted.', ['result'])
+FLOOD_MUTES = Counter('bot_flood_mutes_total', 'Users muted by the anti-flood check.')
+
+def _cache_stats(attribute):
+    caches = {"admins": admin_cache, "membership": membership_cache, "inline_search": search_cache,
+              "render": poll_renderer, "media": media_cache}
+    return {(name,): getattr(cache, attribute) for name, cache in caches.items()}
+
+CallbackMetric('bot_cache_hits_total', 'Cache hits.', lambda: _cache_stats('hits'), type='counter', labelnames=['cache'])
+CallbackMetric('bot_cache_misses_total', 'Cache misses.', lambda: _cache_stats('misses'), type='counter', labelnames=['cache'])
+CallbackMetric('bot_outbox_depth', 'Outgoing calls waiting to be sent.', lambda: outbox.depth)
+CallbackMetric('bot_outbox_sent_total', 'Outgoing calls sent.', lambda: outbox.sent, type='counter')
+CallbackMetric('bot_outbox_failed_total', 'Outgoing calls that failed for good.', lambda: outbox.failed, type='counter')
+CallbackMetric('bot_outbox_retried_total', 'Outgoing calls retried.', lambda: outbox.retried, type='counter')
+CallbackMetric('bot_outbox_dropped_total', 'Bulk calls dropped because their chat had too many waiting.',
+               lambda: outbox.dropped, type='counter')
+CallbackMetric('bot_tracked_polls', 'Polls held in the tally cache.', lambda: len(tally_cache.polls))
+metrics_runner = None
+
+# Seconds spent importing this module, until post_init finished, and warming caches afterwards
+startup_timings = {}
+CallbackMetric('bot_startup_seconds', 'Duration of each startup phase.',
+               lambda: {(phase,): seconds for phase, seconds in startup_timings.items()}, labelnames=['phase'])
+warm_up_task = None
+
+async def log_outbox_stats(context: ContextTypes.DEFAULT_TYPE):
+    stats = outbox.stats()
+    if stats["depth"] or stats["failed"] or stats["dropped"]:
+        logger.info(f"Outbox: {stats}")
+
+async def get_poll_data(poll_id):
+    tally = await tally_cache.ensure(poll_id)
+    if not tally:
         return None, None, None, None
-    _, creator_id, creator_username, title, image_url = poll
-    c.execute("SELECT option_text FROM options WHERE poll_id = ? ORDER BY option_index", (poll_id,))
-    options = [row[0] for row in c.fetchall()]
-    return title, creator_username, options, image_url
-
-def get_vote_counts(poll_id):
-    c.execute("SELECT option_index, COUNT(*) FROM votes WHERE poll_id = ? GROUP BY option_index", (poll_id,))
-    vote_counts = {row[0]: row[1] for row in c.fetchall()}
-    return vote_counts
-
-def create_poll_message_and_keyboard(poll_id, title, options, vote_counts, is_results_mode=False):
-    total_votes = sum(vote_counts.values())
-    poll_text = f"📊 **{title}**\n\n"
-    keyboard_buttons = []
-    for i, option_text in enumerate(options):
-        count = vote_counts.get(i, 0)
-        percentage = (count / total_votes) * 100 if total_votes > 0 else 0
-        if is_results_mode:
-            poll_text += f"**{option_text}** - {count} votes ({percentage:.2f}%)\n"
-        callback_data = f"vote_{poll_id}_{i}"
-        keyboard_buttons.append([InlineKeyboardButton(option_text, callback_data=callback_data)])
-    
-    keyboard = InlineKeyboardMarkup(keyboard_buttons)
-    reaction_buttons = [
-        InlineKeyboardButton("👍", callback_data=f"react_{poll_id}_like"),
-        InlineKeyboardButton("👎", callback_data=f"react_{poll_id}_dislike"),
-        InlineKeyboardButton("❤️", callback_data=f"react_{poll_id}_heart"),
-        InlineKeyboardButton("😂", callback_data=f"react_{poll_id}_laugh")
-    ]
-    keyboard_rows = keyboard.inline_keyboard + [reaction_buttons]
-    vote_count_button = InlineKeyboardButton(f"Total Votes: {total_votes}", callback_data=f"results_{poll_id}")
-    keyboard_rows.append([vote_count_button])
-    return poll_text, InlineKeyboardMarkup(keyboard_rows)
+    return tally.title, tally.creator_username, tally.options, tally.image_url
+
+async def flush_votes(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await tally_cache.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush votes: {e}")
+
+async def on_startup(application: Application):
+    global warm_up_task, metrics_runner
+    await outbox.start()
+    # Start taking updates right away; handlers wait for whatever they need
+    # (the database opens on first query, polls via tally_cache.ensure)
+    warm_up_task = asyncio.create_task(warm_up())
+    if BOT_MODE != 'webhook' and METRICS_PORT:
+        from webhook import start_status_server
+        metrics_runner = await start_status_server(application, WEBHOOK_LISTEN, METRICS_PORT)
+    startup_timings["startup"] = time.perf_counter() - IMPORT_STARTED
+    logger.info(f"Started in {startup_timings['startup']:.2f}s (import {startup_timings['import']:.2f}s)")
+
+async def warm_up():
+    """Open the database and fill the caches in the background."""
+    started = time.perf_counter()
+    try:
+        await storage.open()
+        await tally_cache.load()
+        for chat_id, threshold, window in await storage.get_flood_limits():
+            flood_control.set_limits(chat_id, threshold, window)
+        await media_cache.load()
+        await storage.load_group_settings()
+    except Exception as e:
+        logger.error(f"Failed to warm up caches: {e}")
+        # Fail poll lookups instead of leaving them waiting for the tallies
+        tally_cache.load_failed(e)
+        return
+    startup_timings["warm_up"] = time.perf_counter() - started
+    logger.info(f"Caches warmed up in {startup_timings['warm_up']:.2f}s")
+
+async def on_stop(application: Application):
+    # Runs before the bot's HTTP client is shut down, so queued messages can still go out
+    await welcome_batcher.flush_all()
+    await outbox.stop()
+
+async def on_shutdown(application: Application):
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    await tally_cache.flush()
+    await storage.close()
+    if state_backend:
+        await state_backend.close()
+
+def create_poll_message_and_keyboard(tally, is_results_mode=False):
+    return poll_renderer.render(tally, is_results_mode)
 
 # --- Command Handlers ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -170,12 +222,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("❤️ Romantic Chat", callback_data="start_romantic_chat")],
         [InlineKeyboardButton("ℹ️ Help", callback_data="help")]
     ]
-    await update.message.reply_photo(
+    outbox.submit(update.effective_chat.id, functools.partial(
+        cached_photo(update.message.reply_photo),
         photo=WELCOME_IMAGE_URL,
         caption=caption,
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode=ParseMode.MARKDOWN
-    )
+    ), urgent=True)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
@@ -185,20 +238,24 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/help - Show this help message.\n"
         "/romantic - Start a romantic chat with me.\n\n"
         "**Poll Commands:**\n"
-        "/create - Start creating a new poll.\n\n"
+        "/create - Start creating a new poll.\n"
+        "/stats [poll_id] - Turnout and results of a poll you created.\n"
+        "/close [poll_id] [hours] - Close a poll you created, now or after some hours.\n\n"
         "**Admin Commands:**\n"
         "/setwelcome [message] - Set a custom welcome message.\n"
         "/kick [user] - Kick a user from the group.\n"
         "/ban [user] - Ban a user from the group.\n"
         "/mute [user] [duration] - Mute a user for a specified duration (e.g., /mute @user 30m).\n"
+        "/setflood [messages] [seconds] - Set this group's anti-flood limit.\n"
+        "/top - Most voted polls (bot owner only).\n"
         "/unmute [user] - Unmute a user.\n"
     )
-    await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+    reply(update, help_text, parse_mode=ParseMode.MARKDOWN)
 
 # --- Romantic Chatbot Logic ---
 async def start_romantic_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.effective_user.first_name
-    await update.message.reply_text(f"Hello, my love. It’s so good to talk to you, {user_name}. What's on your mind? ✨")
+    reply(update, f"Hello, my love. It’s so good to talk to you, {user_name}. What's on your mind? ✨")
     return ROMANTIC_CHAT
 
 def get_romantic_response(user_input: str) -> str:
@@ -222,126 +279,278 @@ async def handle_romantic_message(update: Update, context: ContextTypes.DEFAULT_
         [InlineKeyboardButton("Stop the chat", callback_data="end_romantic_chat")]
     ])
     
-    await update.message.reply_text(response, reply_markup=keyboard)
+    reply(update, response, reply_markup=keyboard)
     return ROMANTIC_CHAT
 
 async def end_romantic_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("The romantic chat has ended. If you need me, just say the word. 🥰")
+    reply(update, "The romantic chat has ended. If you need me, just say the word. 🥰")
     return ConversationHandler.END
 
 # --- Poll Bot Logic ---
 async def create(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("What's the title of your poll?")
+    if partitioner and update.effective_chat.type != 'private':
+        # Replies in a group would reach that group's worker, which doesn't hold this conversation
+        reply(update, f"Please create polls in a private chat with @{BOT_USERNAME}.")
+        return ConversationHandler.END
+    reply(update, "What's the title of your poll?")
     return POLL_TITLE
 
 async def receive_poll_title(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['title'] = update.message.text
-    await update.message.reply_text("Great! Now send me the options, one per line.")
+    reply(update, "Great! Now send me the options, one per line.")
     return POLL_OPTIONS
 
 async def receive_poll_options(update: Update, context: ContextTypes.DEFAULT_TYPE):
     options = [opt.strip() for opt in update.message.text.split('\n') if opt.strip()]
     if len(options) < 2:
-        await update.message.reply_text("Please provide at least two options. Try again.")
+        reply(update, "Please provide at least two options. Try again.")
         return POLL_OPTIONS
     
     context.user_data['options'] = options
-    await update.message.reply_text("Please send an image URL for the poll.")
+    reply(update, "Please send an image URL for the poll.")
     return POLL_IMAGE
 
 async def receive_poll_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    image_url = update.message.text
+    image_url = update.message.text.strip()
+    if not is_url(image_url):
+        reply(update, "Please send a link starting with http:// or https://.")
+        return POLL_IMAGE
     poll_id = generate_poll_id()
     creator_id = update.message.from_user.id
     creator_username = update.message.from_user.username
     title = context.user_data['title']
     options = context.user_data['options']
 
-    c.execute("INSERT INTO polls VALUES (?, ?, ?, ?, ?)", (poll_id, creator_id, creator_username, title, image_url))
-    for i, opt_text in enumerate(options):
-        c.execute("INSERT INTO options VALUES (?, ?, ?)", (poll_id, i, opt_text))
-    conn.commit()
+    closes_at = int(time.time() + POLL_DURATION_HOURS * 3600) if POLL_DURATION_HOURS else None
+    tally = await tally_cache.create_poll(poll_id, creator_id, creator_username, title, options, image_url, closes_at)
 
-    vote_counts = get_vote_counts(poll_id)
-    poll_text, keyboard = create_poll_message_and_keyboard(poll_id, title, options, vote_counts)
+    poll_text, keyboard = create_poll_message_and_keyboard(tally)
     
-    await update.message.reply_text(
-        f"Poll created! Share this link:\nhttps://t.me/{BOT_USERNAME}?start={poll_id}",
+    reply(
+        update,
+        f"Poll created! Share this link:\nhttps://t.me/{BOT_USERNAME}?start={poll_id}"
+        + (f"\nVoting closes {format_time(closes_at)}." if closes_at else ""),
         parse_mode=ParseMode.MARKDOWN
     )
     
-    try:
-        channel_post_caption = (
-            f"**New Poll by @{creator_username}**\n\n"
-            f"{poll_text}"
-            f"\n\n_This post is generated by @{BOT_USERNAME}_"
-        )
-        await context.bot.send_photo(
-            chat_id=CHANNEL_ID,
-            photo=image_url,
-            caption=channel_post_caption,
-            reply_markup=keyboard,
-            parse_mode=ParseMode.MARKDOWN
-        )
-    except Exception as e:
-        logger.error(f"Failed to post to channel: {e}")
+    channel_post_caption = (
+        f"**New Poll by @{creator_username}**\n\n"
+        f"{poll_text}"
+        f"\n\n_This post is generated by @{BOT_USERNAME}_"
+    )
+    # Urgent: the creator was told the poll exists, so the bulk cap must not drop its post
+    send_later(
+        cached_photo(context.bot.send_photo),
+        chat_id=CHANNEL_ID,
+        urgent=True,
+        photo=image_url,
+        caption=channel_post_caption,
+        reply_markup=keyboard,
+        parse_mode=ParseMode.MARKDOWN
+    )
 
     context.user_data.clear()
     return ConversationHandler.END
 
-async def vote_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# --- Poll Analytics ---
+def format_time(timestamp):
+    if not timestamp:
+        return "unknown"
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+
+async def poll_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats <poll_id>: answered from the vote rollups, so it stays fast for any number of votes."""
+    if not context.args:
+        reply(update, "Usage: `/stats [poll_id]`", parse_mode=ParseMode.MARKDOWN)
+        return
+    poll_id = context.args[0]
+    stats = await storage.get_poll_stats(poll_id)
+    if not stats:
+        reply(update, "This poll doesn't exist.")
+        return
+    title, creator_id, total_votes, first_vote_at, last_vote_at, option_counts, timeline = stats
+    if update.effective_user.id not in (creator_id, ADMIN_ID):
+        reply(update, "Only the poll's creator can see its stats.")
+        return
+
+    tally = await tally_cache.ensure(poll_id)
+    options = tally.options if tally else [f"Option {i + 1}" for i in range(max(option_counts, default=-1) + 1)]
+    lines = [
+        f"📊 *Stats for {escape_markdown(title)}*",
+        f"Total votes: {total_votes}",
+        f"First vote: {format_time(first_vote_at)}",
+        f"Last vote: {format_time(last_vote_at)}",
+        "",
+        "*Results:*",
+    ]
+    for i, option in enumerate(options):
+        count = option_counts.get(i, 0)
+        percentage = count / total_votes * 100 if total_votes else 0
+        lines.append(f"{escape_markdown(option)}: {count} ({percentage:.1f}%)")
+    if timeline:
+        lines += ["", "*Votes per hour:*"]
+        for bucket, count in timeline:
+            lines.append(f"`{format_time(bucket) if bucket else 'before tracking'}`: {count}")
+    reply(update, "\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
+async def top_polls(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        reply(update, "Only the bot owner can use this command.")
+        return
+    polls = await storage.top_polls(10)
+    if not polls:
+        reply(update, "No votes yet.")
+        return
+    lines = ["🏆 *Top polls*"]
+    for rank, (poll_id, title, total_votes) in enumerate(polls, 1):
+        lines.append(f"{rank}. {escape_markdown(title)}: {total_votes} votes (`{poll_id}`)")
+    reply(update, "\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
+# --- Poll Lifecycle ---
+async def close_poll(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        reply(update, "Usage: `/close [poll_id] [hours]`", parse_mode=ParseMode.MARKDOWN)
+        return
+    poll_id = context.args[0]
+    owner = await storage.get_poll_owner(poll_id)
+    if not owner:
+        reply(update, "This poll doesn't exist.")
+        return
+    creator_id, status = owner
+    if update.effective_user.id not in (creator_id, ADMIN_ID):
+        reply(update, "Only the poll's creator can close it.")
+        return
+    if status != 'open':
+        reply(update, "This poll is already closed.")
+        return
+    now = int(time.time())
+    if len(context.args) > 1:
+        try:
+            hours = float(context.args[1])
+        except ValueError:
+            hours = 0
+        if hours <= 0:
+            reply(update, "Please give the number of hours as a positive number.")
+            return
+        closes_at = int(now + hours * 3600)
+        await tally_cache.set_closes_at(poll_id, closes_at)
+        reply(update, f"Voting closes {format_time(closes_at)}.")
+        return
+    await tally_cache.set_closes_at(poll_id, now)
+    await close_due_polls(now)
+    reply(update, "Poll closed. Its final results stay available.")
+
+async def close_due_polls(now):
+    for poll_id in await storage.close_due_polls(now):
+        tally_cache.close(poll_id)
+
+async def archive_polls(context: ContextTypes.DEFAULT_TYPE):
+    """Close polls past their closing time, then archive polls closed for POLL_ARCHIVE_AFTER_HOURS.
+
+    Archiving keeps a poll's final counts and deletes its raw votes; each
+    run handles a bounded number of polls and then returns the freed pages
+    to the filesystem.
+    """
+    now = int(time.time())
+    try:
+        await close_due_polls(now)
+        # Votes still in the write-behind queue must be in the database before counting
+        await tally_cache.flush()
+        poll_ids = await storage.polls_to_archive(now - int(POLL_ARCHIVE_AFTER_HOURS * 3600))
+        for poll_id in poll_ids:
+            tally_cache.archive(poll_id, await storage.archive_poll(poll_id, ARCHIVE_BATCH))
+        if poll_ids:
+            freed = await storage.incremental_vacuum()
+            logger.info(f"Archived {len(poll_ids)} polls and freed {freed} database pages")
+    except Exception as e:
+        logger.error(f"Failed to archive polls: {e}")
+
+async def poll_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Single entry point for vote, results and reaction buttons (current and legacy data)."""
+    query = update.callback_query
+    callback = decode_callback(query.data)
+    if callback is None:
+        await query.answer()
+        return
+    if callback.action == VOTE and callback.arg and callback.arg.isdigit():
+        await vote_callback(update, context, callback.poll_id, int(callback.arg))
+    elif callback.action == RESULTS:
+        await query.answer()
+        await show_results(update, context, callback.poll_id)
+    elif callback.action == REACT:
+        await reaction_callback(update, context, callback.poll_id, callback.arg)
+    else:
+        await query.answer()
+
+async def vote_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, poll_id: str, option_index: int):
     query = update.callback_query
-    await query.answer()
-    
-    parts = query.data.split('_')
-    poll_id = parts[1]
-    option_index = int(parts[2])
     voter_id = query.from_user.id
     voter_username = query.from_user.username
-    
-    c.execute("SELECT * FROM votes WHERE poll_id = ? AND voter_id = ?", (poll_id, voter_id))
-    if c.fetchone():
-        await query.message.reply_text("You have already voted in this poll. Here are the live results.")
+
+    # Confirmations are popups for the voter, not messages in the channel
+    tally = await tally_cache.ensure(poll_id)
+    if tally and not tally.is_open:
+        VOTES.inc(result="closed")
+        await query.answer("This poll is closed.")
+    elif await tally_cache.record_vote(poll_id, voter_id, voter_username, option_index):
+        VOTES.inc(result="accepted")
+        await query.answer("Vote received!")
     else:
-        c.execute("INSERT INTO votes VALUES (?, ?, ?, ?)", (poll_id, voter_id, voter_username, option_index))
-        conn.commit()
-        await query.message.reply_text("Vote received! Here are the live results.")
-    await show_results(update, context, poll_id=poll_id)
-
-async def show_results(update: Update, context: ContextTypes.DEFAULT_TYPE, poll_id=None):
-    if not poll_id:
-        query = update.callback_query
-        poll_id = query.data.split('_')[1]
-        
-    title, creator_username, options, image_url = get_poll_data(poll_id)
-    if not title:
+        VOTES.inc(result="duplicate")
+        await query.answer("You have already voted in this poll.")
+    await show_results(update, context, poll_id)
+
+def render_live_results(poll_id, with_caption=True):
+    tally = tally_cache.get(poll_id)
+    if not tally:
+        return None, None
+    poll_text, keyboard = create_poll_message_and_keyboard(tally, is_results_mode=True)
+    if not with_caption:
+        return None, keyboard
+    heading = "Live Results" if tally.is_open else "Final Results"
+    caption = f"**{heading}**\n\n{poll_text}\n\n_This post is generated by @{BOT_USERNAME}_"
+    return caption, keyboard
+
+# Results edits go out ahead of bulk messages to the same channel
+results_refresher = ResultsRefresher(render_live_results, interval=RESULTS_EDIT_INTERVAL,
+                                     send=functools.partial(outbox.send, priority=Outbox.EDIT))
+
+async def show_results(update: Update, context: ContextTypes.DEFAULT_TYPE, poll_id: str):
+    message = update.effective_message
+    if not message or not (await get_poll_data(poll_id))[0]:
         return
-        
-    vote_counts = get_vote_counts(poll_id)
-    poll_text, _ = create_poll_message_and_keyboard(poll_id, title, options, vote_counts, is_results_mode=True)
-    await update.effective_message.edit_caption(
-        caption=f"**Live Results**\n\n{poll_text}\n\n_This post is generated by @{BOT_USERNAME}_",
-        parse_mode=ParseMode.MARKDOWN
-    )
+    # Many votes on the same post collapse into at most one edit per interval
+    results_refresher.schedule(context.bot, message.chat_id, message.message_id, poll_id)
+
+async def reaction_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, poll_id: str, reaction: str):
+    query = update.callback_query
+    if reaction not in REACTIONS or not (await get_poll_data(poll_id))[0]:
+        await query.answer("This poll doesn't exist.")
+        return
+
+    current = await tally_cache.toggle_reaction(poll_id, query.from_user.id, reaction)
+    await query.answer(f"You reacted {REACTIONS[current]}" if current else "Reaction removed")
+    if query.message:
+        # Only the buttons change; edits are batched with vote refreshes of the same post
+        results_refresher.schedule(context.bot, query.message.chat_id, query.message.message_id, poll_id, keyboard_only=True)
 
 async def handle_deep_link(update: Update, context: ContextTypes.DEFAULT_TYPE, poll_id: str):
-    title, creator_username, options, image_url = get_poll_data(poll_id)
+    title, creator_username, options, image_url = await get_poll_data(poll_id)
     if not title:
-        await update.message.reply_text("This poll doesn't exist.")
+        reply(update, "This poll doesn't exist.")
         return
     user_id = update.effective_user.id
     try:
-        member = await context.bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        if member.status in ['member', 'creator', 'administrator']:
-            vote_counts = get_vote_counts(poll_id)
-            poll_text, keyboard = create_poll_message_and_keyboard(poll_id, title, options, vote_counts)
-            await update.message.reply_text("You've been successfully redirected to the channel. Vote there!")
+        if await membership_cache.is_member(context.bot, CHANNEL_ID, user_id):
+            poll_text, keyboard = create_poll_message_and_keyboard(tally_cache.get(poll_id))
+            reply(update, "You've been successfully redirected to the channel. Vote there!")
             channel_post_caption = (
                 f"**A new participant has joined!**\n\n"
                 f"**{update.effective_user.full_name}** has followed the link from **@{BOT_USERNAME}**.\n\n"
                 f"Check out this poll:\n\n{poll_text}"
             )
-            await context.bot.send_photo(
+            send_later(
+                cached_photo(context.bot.send_photo),
                 chat_id=CHANNEL_ID,
                 photo=image_url,
                 caption=channel_post_caption,
@@ -349,17 +558,26 @@ async def handle_deep_link(update: Update, context: ContextTypes.DEFAULT_TYPE, p
                 parse_mode=ParseMode.MARKDOWN
             )
         else:
-            await update.message.reply_text("You must be a member of our channel to vote. Please join first and try again.")
+            reply(update, "You must be a member of our channel to vote. Please join first and try again.")
     except Exception as e:
         logger.error(f"Failed to check channel membership: {e}")
-        await update.message.reply_text("An error occurred. Please try again later.")
+        reply(update, "An error occurred. Please try again later.")
 
 async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.inline_query.query
+    query = update.inline_query.query.strip()
+    offset = int(update.inline_query.offset) if update.inline_query.offset.isdigit() else 0
     results = []
+    next_offset = None
     if query:
-        c.execute("SELECT poll_id, title FROM polls WHERE title LIKE ?", (f"%{query}%",))
-        for poll_id, title in c.fetchall():
+        # Ask for one extra row to know whether there is another page
+        matches = await search_cache.get(
+            (query.lower(), offset),
+            lambda: storage.search_polls(query, limit=INLINE_PAGE_SIZE + 1, offset=offset)
+        )
+        if len(matches) > INLINE_PAGE_SIZE:
+            matches = matches[:INLINE_PAGE_SIZE]
+            next_offset = str(offset + INLINE_PAGE_SIZE)
+        for poll_id, title in matches:
             results.append(
                 InlineQueryResultArticle(
                     id=poll_id,
@@ -370,148 +588,175 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     description=f"Click to share poll: {title}"
                 )
             )
-    await update.inline_query.answer(results)
+    await update.inline_query.answer(results, next_offset=next_offset)
 
 # --- Group Help Bot Logic ---
 async def new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    for member in update.message.new_chat_members:
-        if member.is_bot:
-            continue
-        chat_id = update.effective_chat.id
-        group_settings = get_group_settings(chat_id)
-        if group_settings:
-            welcome_message = group_settings[0]
-            welcome_image_url = group_settings[1]
-        else:
-            welcome_message = "Welcome to the group, {name}!"
-            welcome_image_url = WELCOME_IMAGE_URL
-
-        welcome_text = welcome_message.format(name=member.full_name)
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("Join our Channel", url=f"https://t.me/{BOT_USERNAME}?startgroup=true")]
-        ])
-        if welcome_image_url:
-            await context.bot.send_photo(
-                chat_id=chat_id,
-                photo=welcome_image_url,
-                caption=welcome_text,
-                reply_markup=keyboard,
-                parse_mode=ParseMode.MARKDOWN
-            )
-        else:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=welcome_text,
-                reply_markup=keyboard,
-                parse_mode=ParseMode.MARKDOWN
-            )
+    members = [member for member in update.message.new_chat_members if not member.is_bot]
+    if members:
+        # Joins within WELCOME_BATCH_WINDOW seconds share one welcome message
+        welcome_batcher.add(context.bot, update.effective_chat.id, members)
+
+async def send_welcome(bot, chat_id, members):
+    group_settings = await storage.get_group_settings(chat_id)
+    if group_settings and group_settings[0]:
+        welcome_message = group_settings[0]
+        welcome_image_url = group_settings[1]
+    else:
+        welcome_message = "Welcome to the group, {name}!"
+        welcome_image_url = WELCOME_IMAGE_URL
+
+    if len(members) == 1:
+        names = members[0].full_name
+    else:
+        names = ", ".join(
+            f"[{escape_markdown(member.full_name)}](tg://user?id={member.id})" for member in members
+        )
+    welcome_text = welcome_message.format(name=names)
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("Join our Channel", url=f"https://t.me/{BOT_USERNAME}?startgroup=true")]
+    ])
+    if welcome_image_url:
+        send_later(
+            cached_photo(bot.send_photo),
+            chat_id=chat_id,
+            photo=welcome_image_url,
+            caption=welcome_text,
+            reply_markup=keyboard,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    else:
+        send_later(
+            bot.send_message,
+            chat_id=chat_id,
+            text=welcome_text,
+            reply_markup=keyboard,
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+welcome_batcher = WelcomeBatcher(send_welcome, window=WELCOME_BATCH_WINDOW)
 
 async def left_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.left_chat_member.is_bot:
         return
-    await update.message.reply_text(f"Goodbye, {update.message.left_chat_member.full_name}!")
+    reply(update, f"Goodbye, {update.message.left_chat_member.full_name}!")
 
 # Admin functions
+def require_admin(handler):
+    """Only run handler for group admins; admin lists are cached per chat."""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        if not update.effective_chat.type in ['group', 'supergroup']:
+            reply(update, "This command can only be used in a group.")
+            return
+        if not await admin_cache.is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
+            reply(update, "You must be an admin to use this command.")
+            return
+        return await handler(update, context, *args, **kwargs)
+    return wrapper
+
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    change = update.chat_member or update.my_chat_member
+    admin_statuses = ['administrator', 'creator']
+    if change.old_chat_member.status in admin_statuses or change.new_chat_member.status in admin_statuses:
+        admin_cache.invalidate(change.chat.id)
+    if change.chat.id == CHANNEL_ID:
+        membership_cache.update(CHANNEL_ID, change.new_chat_member.user.id, change.new_chat_member.status)
+
+@require_admin
 async def set_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.effective_chat.type in ['group', 'supergroup']:
-        await update.message.reply_text("This command can only be used in a group.")
-        return
-    admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    if update.effective_user.id not in [admin.user.id for admin in admins]:
-        await update.message.reply_text("You must be an admin to use this command.")
-        return
-
     welcome_message = " ".join(context.args)
     if not welcome_message:
-        await update.message.reply_text("Please provide a welcome message. Example: `/setwelcome Welcome {name}!`")
+        reply(update, "Please provide a welcome message. Example: `/setwelcome Welcome {name}!`")
         return
-    update_group_settings(update.effective_chat.id, welcome_message, WELCOME_IMAGE_URL)
-    await update.message.reply_text("Welcome message updated successfully.")
+    await storage.update_group_settings(update.effective_chat.id, welcome_message, WELCOME_IMAGE_URL)
+    reply(update, "Welcome message updated successfully.")
 
+@require_admin
 async def kick_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.effective_chat.type in ['group', 'supergroup']:
-        await update.message.reply_text("This command can only be used in a group.")
-        return
-    admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    if update.effective_user.id not in [admin.user.id for admin in admins]:
-        await update.message.reply_text("You must be an admin to use this command.")
-        return
     if not update.message.reply_to_message:
-        await update.message.reply_text("Please reply to a user's message to kick them.")
+        reply(update, "Please reply to a user's message to kick them.")
         return
     user_to_kick = update.message.reply_to_message.from_user
     try:
         await context.bot.kick_chat_member(update.effective_chat.id, user_to_kick.id)
-        await update.message.reply_text(f"Kicked {user_to_kick.full_name}.")
+        reply(update, f"Kicked {user_to_kick.full_name}.")
     except Exception as e:
-        await update.message.reply_text(f"Could not kick user. Error: {e}")
+        reply(update, f"Could not kick user. Error: {e}")
 
+@require_admin
 async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.effective_chat.type in ['group', 'supergroup']:
-        await update.message.reply_text("This command can only be used in a group.")
-        return
-    admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    if update.effective_user.id not in [admin.user.id for admin in admins]:
-        await update.message.reply_text("You must be an admin to use this command.")
-        return
     if not update.message.reply_to_message:
-        await update.message.reply_text("Please reply to a user's message to ban them.")
+        reply(update, "Please reply to a user's message to ban them.")
         return
     user_to_ban = update.message.reply_to_message.from_user
     try:
         await context.bot.ban_chat_member(update.effective_chat.id, user_to_ban.id)
-        await update.message.reply_text(f"Banned {user_to_ban.full_name}.")
+        reply(update, f"Banned {user_to_ban.full_name}.")
     except Exception as e:
-        await update.message.reply_text(f"Could not ban user. Error: {e}")
+        reply(update, f"Could not ban user. Error: {e}")
 
+@require_admin
 async def mute_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.effective_chat.type in ['group', 'supergroup']:
-        await update.message.reply_text("This command can only be used in a group.")
-        return
-    admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    if update.effective_user.id not in [admin.user.id for admin in admins]:
-        await update.message.reply_text("You must be an admin to use this command.")
-        return
     if not update.message.reply_to_message:
-        await update.message.reply_text("Please reply to a user's message to mute them.")
+        reply(update, "Please reply to a user's message to mute them.")
         return
     user_to_mute = update.message.reply_to_message.from_user
     duration_minutes = 10 
     if context.args and context.args[0].isdigit():
         duration_minutes = int(context.args[0])
     try:
-        until_date = datetime.now() + timedelta(minutes=duration_minutes)
+        mute_until = await storage.add_mute(update.effective_chat.id, user_to_mute.id, duration_minutes)
         await context.bot.restrict_chat_member(
             chat_id=update.effective_chat.id,
             user_id=user_to_mute.id,
-            until_date=until_date,
+            until_date=datetime.fromtimestamp(mute_until, tz=timezone.utc),
             permissions={"can_send_messages": False}
         )
-        add_mute(update.effective_chat.id, user_to_mute.id, duration_minutes)
-        await update.message.reply_text(f"Muted {user_to_mute.full_name} for {duration_minutes} minutes.")
+        reply(update, f"Muted {user_to_mute.full_name} for {duration_minutes} minutes.")
     except Exception as e:
-        await update.message.reply_text(f"Could not mute user. Error: {e}")
+        reply(update, f"Could not mute user. Error: {e}")
+
+@require_admin
+async def set_flood(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) != 2 or not all(arg.isdigit() and int(arg) > 0 for arg in context.args):
+        threshold, window = flood_control.get_limits(update.effective_chat.id)
+        reply(
+            update,
+            f"Current limit: {threshold} messages per {window} seconds.\nUsage: `/setflood [messages] [seconds]`",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    threshold, window = int(context.args[0]), int(context.args[1])
+    await storage.set_flood_limits(update.effective_chat.id, threshold, window)
+    flood_control.set_limits(update.effective_chat.id, threshold, window)
+    reply(update, f"Flood limit set to {threshold} messages per {window} seconds.")
 
 async def anti_flood_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user:
+        return
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
-    current_time = time.time()
-    if user_id not in user_last_messages:
-        user_last_messages[user_id] = []
-    user_last_messages[user_id].append(current_time)
-    user_last_messages[user_id] = [t for t in user_last_messages[user_id] if current_time - t < FLOOD_TIME_WINDOW]
-    if len(user_last_messages[user_id]) > FLOOD_THRESHOLD:
+    if shared_flood_control:
+        flooding = await shared_flood_control.hit(chat_id, user_id)
+    else:
+        flooding = flood_control.hit(chat_id, user_id)
+    if flooding:
         await mute_user_for_flood(update, context, user_id, chat_id)
 
 async def mute_user_for_flood(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id, chat_id):
     try:
+        mute_until = await storage.add_mute(chat_id, user_id, FLOOD_MUTE_MINUTES)
+        # Same expiry as the stored mute; an aware datetime so the host's timezone doesn't matter
         await context.bot.restrict_chat_member(
             chat_id=chat_id,
             user_id=user_id,
+            until_date=datetime.fromtimestamp(mute_until, tz=timezone.utc),
             permissions={"can_send_messages": False}
         )
-        add_mute(chat_id, user_id, 10)
-        await context.bot.send_message(
+        FLOOD_MUTES.inc()
+        send_later(
+            context.bot.send_message,
             chat_id=chat_id,
             text=f"**@{update.effective_user.username}** has been muted for spamming.",
             parse_mode=ParseMode.MARKDOWN
@@ -519,9 +764,57 @@ async def mute_user_for_flood(update: Update, context: ContextTypes.DEFAULT_TYPE
     except Exception as e:
         logger.error(f"Failed to mute user: {e}")
 
+async def sweep_expired_mutes(context: ContextTypes.DEFAULT_TYPE):
+    """Lift expired mutes in batches, oldest first, using the mute_until index.
+
+    Runs once right after startup too, which catches up on mutes that
+    expired while the bot was down.
+    """
+    now = int(time.time())
+    chat_permissions = {}
+    while True:
+        expired = await storage.expired_mutes(now, MUTE_SWEEP_BATCH)
+        for chat_id, user_id in expired:
+            try:
+                # Restore the group's default permissions rather than granting everything
+                if chat_id not in chat_permissions:
+                    chat_permissions[chat_id] = (await context.bot.get_chat(chat_id)).permissions
+                await context.bot.restrict_chat_member(
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    permissions=chat_permissions[chat_id]
+                )
+            except Exception as e:
+                logger.warning(f"Failed to unmute {user_id} in {chat_id}: {e}")
+        await storage.remove_expired_mutes(expired, now)
+        if len(expired) < MUTE_SWEEP_BATCH:
+            break
+    if chat_permissions:
+        logger.info(f"Lifted expired mutes in {len(chat_permissions)} chats")
+
 # --- Main Function to Run Bot ---
-def main():
-    application = Application.builder().token(TOKEN).build()
+def build_application(token=TOKEN, base_url=None):
+    """Create the Application with all jobs and handlers registered.
+
+    `base_url` points the bot at another Bot API server, such as a local
+    one or the fake server used by the benchmarks.
+    """
+    # Bot API calls are timed per method; the pool size matches the builder's default
+    builder = (
+        Application.builder().token(token).request(InstrumentedRequest(connection_pool_size=256))
+        .post_init(on_startup).post_stop(on_stop).post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if state_backend:
+        # Conversations and user data survive restarts and moving chats between workers
+        builder = builder.persistence(BackendPersistence(state_backend, update_interval=STATE_SYNC_INTERVAL))
+    application = builder.build()
+    application.job_queue.run_repeating(flush_votes, interval=VOTE_FLUSH_INTERVAL)
+    application.job_queue.run_repeating(sweep_expired_mutes, interval=MUTE_SWEEP_INTERVAL, first=0)
+    application.job_queue.run_repeating(log_outbox_stats, interval=60)
+    if partitioner is None or partitioner.owns_polls:
+        application.job_queue.run_repeating(archive_polls, interval=ARCHIVE_INTERVAL, first=60)
     
     # Conversation handler for poll creation
     poll_conv_handler = ConversationHandler(
@@ -534,7 +827,9 @@ def main():
             POLL_OPTIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_poll_options)],
             POLL_IMAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_poll_image)],
         },
-        fallbacks=[CommandHandler('cancel', lambda u, c: ConversationHandler.END)]
+        fallbacks=[CommandHandler('cancel', lambda u, c: ConversationHandler.END)],
+        name="poll_creation",
+        persistent=state_backend is not None
     )
     
     # Conversation handler for romantic chat
@@ -549,7 +844,9 @@ def main():
                 CallbackQueryHandler(end_romantic_chat, pattern="^end_romantic_chat$")
             ],
         },
-        fallbacks=[CommandHandler('end', end_romantic_chat)]
+        fallbacks=[CommandHandler('end', end_romantic_chat)],
+        name="romantic_chat",
+        persistent=state_backend is not None
     )
 
     application.add_handler(CommandHandler("start", start))
@@ -558,16 +855,34 @@ def main():
     application.add_handler(CommandHandler("kick", kick_user))
     application.add_handler(CommandHandler("ban", ban_user))
     application.add_handler(CommandHandler("mute", mute_user))
+    application.add_handler(CommandHandler("setflood", set_flood))
+    application.add_handler(CommandHandler("stats", poll_stats))
+    application.add_handler(CommandHandler("top", top_polls))
+    application.add_handler(CommandHandler("close", close_poll))
     application.add_handler(poll_conv_handler)
     application.add_handler(romantic_chat_handler)
-    application.add_handler(CallbackQueryHandler(vote_callback, pattern=re.compile(r'^vote_.*')))
-    application.add_handler(CallbackQueryHandler(show_results, pattern=re.compile(r'^results_.*')))
+    application.add_handler(CallbackQueryHandler(poll_callback, pattern=CALLBACK_PATTERN))
     application.add_handler(InlineQueryHandler(inline_query))
     application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, new_member))
     application.add_handler(MessageHandler(filters.StatusUpdate.LEFT_CHAT_MEMBER, left_member))
+    application.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.ANY_CHAT_MEMBER))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, anti_flood_check))
+    instrument_handlers(application)
+    return application
+
+def main():
+    missing = missing_settings()
+    if missing:
+        raise EnvironmentError(f"Missing environment variables: {', '.join(missing)}")
+    application = build_application()
+    if BOT_MODE == 'webhook':
+        from webhook import run_webhook
+        run_webhook(application, WEBHOOK_LISTEN, PORT, WEBHOOK_PATH, webhook_url=WEBHOOK_URL,
+                    secret_token=WEBHOOK_SECRET, partitioner=partitioner)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
-    application.run_polling(poll_interval=3)
+startup_timings["import"] = time.perf_counter() - IMPORT_STARTED
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,64 @@
+import logging
+import os
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# BadRequest messages meaning a cached file_id can no longer be used
+_STALE_FILE_ID_ERRORS = ('file identifier', 'file_id', 'file reference', 'wrong remote file')
+
+
+def is_url(source):
+    return isinstance(source, str) and source.lower().startswith(('http://', 'https://'))
+
+
+class MediaCache:
+    """Maps image sources (URLs or local files) to Telegram file_ids.
+
+    The first send of a source uploads it (or lets Telegram fetch the URL)
+    and remembers the file_id of the resulting photo; later sends reuse the
+    file_id. If Telegram rejects a cached file_id it is dropped and the
+    source is sent again.
+
+    Only the operator-configured sources in `local_files` may be local
+    paths. Anything else must be an http(s) URL: poll images are user
+    input, and python-telegram-bot uploads any string naming a local file.
+    """
+
+    def __init__(self, storage, local_files=()):
+        self.storage = storage
+        self.local_files = {source for source in local_files if source}
+        self.file_ids = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self):
+        self.file_ids = dict(await self.storage.load_media_file_ids())
+
+    async def send_photo(self, method, photo, **kwargs):
+        """Call method(photo=..., **kwargs), e.g. bot.send_photo or message.reply_photo."""
+        file_id = self.file_ids.get(photo)
+        if file_id:
+            try:
+                self.hits += 1
+                return await method(photo=file_id, **kwargs)
+            except BadRequest as e:
+                if not any(error in str(e).lower() for error in _STALE_FILE_ID_ERRORS):
+                    raise
+                logger.warning(f"Cached file_id for {photo} is no longer valid: {e}")
+                self.file_ids.pop(photo, None)
+                await self.storage.delete_media_file_id(photo)
+        self.misses += 1
+        if photo in self.local_files and os.path.isfile(photo):
+            with open(photo, 'rb') as f:
+                message = await method(photo=f, **kwargs)
+        elif is_url(photo):
+            message = await method(photo=photo, **kwargs)
+        else:
+            raise ValueError(f"Refusing to send {photo!r}: not a URL")
+        if message and message.photo:
+            # The last size is the original resolution
+            self.file_ids[photo] = message.photo[-1].file_id
+            await self.storage.set_media_file_id(photo, self.file_ids[photo])
+        return message
@@ -0,0 +1,182 @@
+"""Minimal Prometheus-style metrics.
+
+Counters, gauges and histograms live in a module-level registry and are
+rendered in the Prometheus text format by `render()`, which the web server
+exposes at /metrics. Values that other objects already track (cache hit
+counts, queue depth) are reported through callbacks instead of being copied.
+"""
+import bisect
+import functools
+import time
+
+from telegram.request import HTTPXRequest
+
+_registry = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # Per-bucket counts, then sum and count
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', bound)]), cumulative
+            yield f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', '+Inf')]), count
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), count
+
+
+class CallbackMetric(_Metric):
+    """Reports values read from `fn()` at scrape time: a number, or a
+    dict mapping label-value tuples to numbers."""
+
+    def __init__(self, name, documentation, fn, type='gauge', labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.fn = fn
+
+    def samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- Instrumentation ---
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Time spent in update handlers.', ['handler'])
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Update handlers that raised.', ['handler'])
+API_SECONDS = Histogram('bot_api_request_seconds', 'Bot API request latency.', ['method', 'status'])
+
+
+def instrument_callback(callback):
+    name = getattr(callback, '__name__', 'unknown')
+
+    @functools.wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        with HANDLER_SECONDS.time(handler=name):
+            try:
+                return await callback(update, context, *args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=name)
+                raise
+    return wrapper
+
+
+def instrument_handlers(application):
+    """Time every handler registered on application, including those nested in conversations."""
+    def instrument(handlers):
+        for handler in handlers:
+            if hasattr(handler, 'entry_points'):
+                instrument(handler.entry_points)
+                for state_handlers in handler.states.values():
+                    instrument(state_handlers)
+                instrument(handler.fallbacks)
+            else:
+                handler.callback = instrument_callback(handler.callback)
+
+    for handlers in application.handlers.values():
+        instrument(handlers)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency and status of every Bot API call."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            status, payload = await super().do_request(url, method, *args, **kwargs)
+            return status, payload
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, method=api_method, status=status)
@@ -0,0 +1,231 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _initial_schema(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS polls (
+            poll_id TEXT PRIMARY KEY,
+            creator_id INTEGER,
+            creator_username TEXT,
+            title TEXT,
+            image_url TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS options (
+            poll_id TEXT,
+            option_index INTEGER,
+            option_text TEXT,
+            PRIMARY KEY (poll_id, option_index),
+            FOREIGN KEY (poll_id) REFERENCES polls(poll_id) ON DELETE CASCADE
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            poll_id TEXT,
+            voter_id INTEGER,
+            voter_username TEXT,
+            option_index INTEGER,
+            FOREIGN KEY (poll_id) REFERENCES polls(poll_id) ON DELETE CASCADE
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS group_settings (
+            chat_id INTEGER PRIMARY KEY,
+            welcome_message TEXT,
+            welcome_image_url TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS active_mutes (
+            chat_id INTEGER,
+            user_id INTEGER,
+            mute_until INTEGER,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    ''')
+
+
+def _vote_constraints(c):
+    # Keep the earliest vote of every (poll, voter) pair before enforcing uniqueness
+    c.execute('''
+        DELETE FROM votes WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM votes GROUP BY poll_id, voter_id
+        )
+    ''')
+    if c.rowcount > 0:
+        logger.warning(f"Removed {c.rowcount} duplicate votes")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_votes_poll_voter ON votes (poll_id, voter_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_polls_title ON polls (title)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_active_mutes_until ON active_mutes (mute_until)")
+
+
+def _flood_settings(c):
+    c.execute("ALTER TABLE group_settings ADD COLUMN flood_threshold INTEGER")
+    c.execute("ALTER TABLE group_settings ADD COLUMN flood_window INTEGER")
+
+
+def _poll_search_index(c):
+    # External-content FTS index over polls.title, kept in sync by triggers
+    c.execute("CREATE VIRTUAL TABLE polls_fts USING fts5(title, content='polls', content_rowid='rowid')")
+    c.execute("INSERT INTO polls_fts (polls_fts) VALUES ('rebuild')")
+    c.execute('''
+        CREATE TRIGGER polls_fts_insert AFTER INSERT ON polls BEGIN
+            INSERT INTO polls_fts (rowid, title) VALUES (new.rowid, new.title);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER polls_fts_delete AFTER DELETE ON polls BEGIN
+            INSERT INTO polls_fts (polls_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER polls_fts_update AFTER UPDATE OF title ON polls BEGIN
+            INSERT INTO polls_fts (polls_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+            INSERT INTO polls_fts (rowid, title) VALUES (new.rowid, new.title);
+        END
+    ''')
+
+
+def _reactions(c):
+    c.execute('''
+        CREATE TABLE reactions (
+            poll_id TEXT,
+            user_id INTEGER,
+            reaction TEXT,
+            PRIMARY KEY (poll_id, user_id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE reaction_counts (
+            poll_id TEXT,
+            reaction TEXT,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (poll_id, reaction)
+        )
+    ''')
+
+
+def _media_cache(c):
+    c.execute('''
+        CREATE TABLE media_cache (
+            source TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            updated_at INTEGER
+        )
+    ''')
+
+
+def _vote_analytics(c):
+    c.execute("ALTER TABLE votes ADD COLUMN voted_at INTEGER")
+    # Votes per poll, hour (start of the hour as a unix time) and option
+    c.execute('''
+        CREATE TABLE vote_rollups (
+            poll_id TEXT,
+            bucket INTEGER,
+            option_index INTEGER,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (poll_id, bucket, option_index)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE poll_stats (
+            poll_id TEXT PRIMARY KEY,
+            total_votes INTEGER NOT NULL,
+            first_vote_at INTEGER,
+            last_vote_at INTEGER
+        )
+    ''')
+    c.execute("CREATE INDEX idx_poll_stats_total ON poll_stats (total_votes)")
+    # Existing votes have no timestamp; they go into bucket 0
+    c.execute("INSERT INTO vote_rollups SELECT poll_id, 0, option_index, COUNT(*) FROM votes GROUP BY poll_id, option_index")
+    c.execute("INSERT INTO poll_stats SELECT poll_id, COUNT(*), NULL, NULL FROM votes GROUP BY poll_id")
+    # Both tables are updated in the transaction that inserts the vote
+    c.execute('''
+        CREATE TRIGGER votes_rollup AFTER INSERT ON votes BEGIN
+            INSERT INTO vote_rollups VALUES (new.poll_id, COALESCE(new.voted_at, 0) / 3600 * 3600, new.option_index, 1)
+                ON CONFLICT (poll_id, bucket, option_index) DO UPDATE SET count = count + 1;
+            INSERT INTO poll_stats VALUES (new.poll_id, 1, new.voted_at, new.voted_at)
+                ON CONFLICT (poll_id) DO UPDATE SET
+                    total_votes = total_votes + 1,
+                    first_vote_at = COALESCE(MIN(first_vote_at, new.voted_at), first_vote_at, new.voted_at),
+                    last_vote_at = COALESCE(MAX(last_vote_at, new.voted_at), last_vote_at, new.voted_at);
+        END
+    ''')
+
+
+def _poll_lifecycle(c):
+    # status is 'open', 'closed' (no more votes) or 'archived' (raw votes deleted)
+    c.execute("ALTER TABLE polls ADD COLUMN status TEXT NOT NULL DEFAULT 'open'")
+    c.execute("ALTER TABLE polls ADD COLUMN closes_at INTEGER")
+    c.execute("ALTER TABLE polls ADD COLUMN closed_at INTEGER")
+    c.execute("CREATE INDEX idx_polls_status_closes ON polls (status, closes_at)")
+    # Final per-option counts (a JSON list) of polls whose raw votes were deleted
+    c.execute('''
+        CREATE TABLE poll_archive (
+            poll_id TEXT PRIMARY KEY,
+            total_votes INTEGER NOT NULL,
+            counts TEXT NOT NULL,
+            archived_at INTEGER
+        )
+    ''')
+
+
+# Ordered (version, step) pairs. Append new steps; never edit or reorder old ones.
+MIGRATIONS = [
+    (1, _initial_schema),
+    (2, _vote_constraints),
+    (3, _flood_settings),
+    (4, _poll_search_index),
+    (5, _reactions),
+    (6, _media_cache),
+    (7, _vote_analytics),
+    (8, _poll_lifecycle),
+]
+
+
+def get_schema_version(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """Bring the database up to the latest schema version.
+
+    Each step runs in its own transaction together with its version bump,
+    so an interrupted upgrade resumes from the last completed step.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    current = get_schema_version(conn)
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN")
+            step(c)
+            c.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            logger.error(f"Schema migration {version} ({step.__name__}) failed")
+            raise
+        logger.info(f"Applied schema migration {version} ({step.__name__})")
+        current = version
+    _enable_incremental_vacuum(conn)
+    return current
+
+
+def _enable_incremental_vacuum(conn):
+    """Let the archiver hand pages freed by deleted votes back to the filesystem.
+
+    auto_vacuum only changes after a full VACUUM, which happens once here.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    logger.info("Enabled incremental vacuum")
@@ -0,0 +1,208 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxFull(Exception):
+    """Raised for bulk calls dropped because their chat already has too many waiting."""
+
+
+class _Job:
+    __slots__ = ('chat_id', 'call', 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, chat_id, call, future):
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class Outbox:
+    """Central queue for outgoing Bot API calls.
+
+    Calls are zero-argument callables returning a coroutine (for example
+    `functools.partial(bot.send_message, chat_id, text)`). Workers send them
+    while staying under a global rate and a minimum interval per chat (longer
+    for groups and channels), retry after RetryAfter and transient network
+    errors, and always pick urgent calls (replies to users) first, then edits
+    of existing messages, then bulk ones. Calls to a chat that isn't ready yet
+    are parked instead of blocking a worker, and calls to the same chat keep
+    their order within a priority. At most `max_bulk_per_chat` bulk calls wait
+    per chat; beyond that new ones fail with OutboxFull instead of piling up.
+    """
+
+    URGENT = 0
+    EDIT = 1
+    BULK = 2
+
+    def __init__(self, global_rate=25, private_interval=0.05, group_interval=1.0, workers=4, max_retries=3,
+                 max_bulk_per_chat=20):
+        self.global_interval = 1 / global_rate
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self.max_bulk_per_chat = max_bulk_per_chat
+        self._queue = None
+        self._tasks = []
+        self._seq = itertools.count()
+        self._global_next = 0.0
+        self._chat_next = {}
+        self._parked = 0
+        self._in_flight = 0
+        self._bulk_waiting = {}
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=1000)
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10):
+        """Give queued calls up to timeout seconds to go out, then stop the workers."""
+        if self._queue is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self.depth or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.depth:
+            logger.warning(f"Dropping {self.depth} unsent messages on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, chat_id, call, urgent=False, priority=None):
+        """Queue a call and return a future for its result.
+
+        `priority` (URGENT, EDIT or BULK) overrides `urgent`. Nobody has to
+        await the future; failures are logged either way.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        if priority is None:
+            priority = self.URGENT if urgent else self.BULK
+        if priority == self.BULK:
+            waiting = self._bulk_waiting.get(chat_id, 0)
+            if waiting >= self.max_bulk_per_chat:
+                self.dropped += 1
+                future.set_exception(OutboxFull(f"{waiting} messages already waiting for {chat_id}"))
+                return future
+            self._bulk_waiting[chat_id] = waiting + 1
+            future.add_done_callback(lambda _: self._bulk_done(chat_id))
+        self._put(priority, _Job(chat_id, call, future))
+        return future
+
+    async def send(self, chat_id, call, urgent=False, priority=None):
+        """Queue a call and wait until it has been sent."""
+        return await self.submit(chat_id, call, urgent, priority)
+
+    @property
+    def depth(self):
+        return (self._queue.qsize() if self._queue else 0) + self._parked
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
+
+    def _bulk_done(self, chat_id):
+        waiting = self._bulk_waiting.pop(chat_id) - 1
+        if waiting:
+            self._bulk_waiting[chat_id] = waiting
+
+    def _put(self, priority, job):
+        self._queue.put_nowait((priority, next(self._seq), job))
+
+    def _put_later(self, delay, priority, seq, job):
+        # Parked jobs keep their sequence number, so they don't lose their place
+        def unpark():
+            self._parked -= 1
+            self._queue.put_nowait((priority, seq, job))
+        self._parked += 1
+        asyncio.get_running_loop().call_later(delay, unpark)
+
+    def _chat_interval(self, chat_id):
+        return self.group_interval if chat_id < 0 else self.private_interval
+
+    async def _worker(self):
+        while True:
+            priority, seq, job = await self._queue.get()
+            now = time.monotonic()
+            chat_ready_at = self._chat_next.get(job.chat_id, 0.0)
+            if chat_ready_at > now:
+                self._put_later(chat_ready_at - now, priority, seq, job)
+                continue
+            self._chat_next[job.chat_id] = now + self._chat_interval(job.chat_id)
+            self._in_flight += 1
+            try:
+                slot = max(now, self._global_next)
+                self._global_next = slot + self.global_interval
+                if slot > now:
+                    await asyncio.sleep(slot - now)
+                await self._send(priority, seq, job)
+            finally:
+                self._in_flight -= 1
+            if len(self._chat_next) > 10000:
+                self._prune(time.monotonic())
+
+    async def _send(self, priority, seq, job):
+        if job.future.done():
+            return
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            self._retry(priority, seq, job, e.retry_after, e)
+            self._chat_next[job.chat_id] = time.monotonic() + e.retry_after
+        except (BadRequest, Forbidden) as e:
+            self._fail(job, e)
+        except NetworkError as e:
+            # Transient, including TimedOut
+            self._retry(priority, seq, job, 2 ** job.attempts, e)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self.sent += 1
+            self.latencies.append(time.monotonic() - job.enqueued_at)
+            job.future.set_result(result)
+
+    def _retry(self, priority, seq, job, delay, error):
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            self._fail(job, error)
+            return
+        self.retried += 1
+        logger.warning(f"Retrying message to {job.chat_id} in {delay}s: {error}")
+        self._put_later(delay, priority, seq, job)
+
+    def _fail(self, job, error):
+        self.failed += 1
+        logger.error(f"Failed to send message to {job.chat_id}: {error}")
+        job.future.set_exception(error)
+
+    def _prune(self, now):
+        for chat_id in [chat_id for chat_id, ready_at in self._chat_next.items() if ready_at <= now]:
+            del self._chat_next[chat_id]
+
+
+
+def _consume_exception(future):
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,140 @@
+"""Offline bulk import/export of polls and votes as JSONL.
+
+Each line is one record:
+
+    {"type": "poll", "poll_id": ..., "creator_id": ..., "creator_username": ...,
+     "title": ..., "image_url": ..., "options": [...], "status": ..., "closes_at": ...,
+     "closed_at": ..., "archived_counts": [...]}
+    {"type": "vote", "poll_id": ..., "voter_id": ..., "voter_username": ..., "option_index": ..., "voted_at": ...}
+
+Both directions stream, so archives larger than memory are fine. Imports
+are idempotent: polls, options and votes that already exist are skipped.
+Archived polls have no vote records; their final counts travel in
+`archived_counts`.
+
+    python polls_cli.py export backup.jsonl
+    python polls_cli.py import --batch-size 50000 backup.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def export_jsonl(conn, out, include_votes=True):
+    """Write every poll (and vote) to out. Returns the number of records written."""
+    written = 0
+    options_cursor = conn.cursor()
+    for poll_id, creator_id, creator_username, title, image_url, status, closes_at, closed_at, archived_counts in conn.execute('''
+            SELECT polls.poll_id, creator_id, creator_username, title, image_url, status, closes_at, closed_at, poll_archive.counts
+            FROM polls LEFT JOIN poll_archive ON poll_archive.poll_id = polls.poll_id ORDER BY polls.rowid'''):
+        options = [row[0] for row in options_cursor.execute(
+            "SELECT option_text FROM options WHERE poll_id = ? ORDER BY option_index", (poll_id,))]
+        record = {"type": "poll", "poll_id": poll_id, "creator_id": creator_id, "creator_username": creator_username,
+                  "title": title, "image_url": image_url, "options": options, "status": status,
+                  "closes_at": closes_at, "closed_at": closed_at}
+        if archived_counts is not None:
+            record["archived_counts"] = json.loads(archived_counts)
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        written += 1
+    if include_votes:
+        for poll_id, voter_id, voter_username, option_index, voted_at in conn.execute(
+                "SELECT poll_id, voter_id, voter_username, option_index, voted_at FROM votes ORDER BY rowid"):
+            record = {"type": "vote", "poll_id": poll_id, "voter_id": voter_id,
+                      "voter_username": voter_username, "option_index": option_index, "voted_at": voted_at}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+def import_jsonl(conn, lines, batch_size=10000):
+    """Insert records from lines in transactions of batch_size records. Returns the number read."""
+    polls, options, votes, archives = [], [], [], []
+    read = 0
+
+    def flush():
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO polls (poll_id, creator_id, creator_username, title, image_url, "
+                             "status, closes_at, closed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", polls)
+            conn.executemany("INSERT OR IGNORE INTO options VALUES (?, ?, ?)", options)
+            conn.executemany("INSERT OR IGNORE INTO poll_archive VALUES (?, ?, ?, ?)", archives)
+            conn.executemany("INSERT OR IGNORE INTO votes (poll_id, voter_id, voter_username, option_index, voted_at) "
+                             "VALUES (?, ?, ?, ?, ?)", votes)
+        polls.clear()
+        options.clear()
+        votes.clear()
+        archives.clear()
+        logger.info(f"Imported {read} records")
+
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record["type"] == "poll":
+            poll_id = record["poll_id"]
+            polls.append((poll_id, record.get("creator_id"), record.get("creator_username"), record["title"],
+                          record.get("image_url"), record.get("status", "open"), record.get("closes_at"),
+                          record.get("closed_at")))
+            options.extend((poll_id, i, text) for i, text in enumerate(record["options"]))
+            if record.get("archived_counts") is not None:
+                counts = record["archived_counts"]
+                archives.append((poll_id, sum(counts), json.dumps(counts), None))
+        elif record["type"] == "vote":
+            votes.append((record["poll_id"], record["voter_id"], record.get("voter_username"), record["option_index"],
+                          record.get("voted_at")))
+        else:
+            raise ValueError(f"Line {line_number}: unknown record type {record['type']!r}")
+        read += 1
+        if read % batch_size == 0:
+            flush()
+    if polls or votes:
+        flush()
+    return read
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export polls and votes as JSONL.")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "bot_data.db"), help="SQLite database (default: $DB_PATH or bot_data.db)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write polls and votes to a JSONL file")
+    export_parser.add_argument("path", help="Output file, or - for stdout")
+    export_parser.add_argument("--no-votes", action="store_true", help="Only export polls")
+    import_parser = subparsers.add_parser("import", help="Load polls and votes from a JSONL file")
+    import_parser.add_argument("path", help="Input file, or - for stdin")
+    import_parser.add_argument("--batch-size", type=int, default=10000, help="Records per transaction")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        level=logging.INFO, stream=sys.stderr)
+    conn = connect(args.db)
+    started = time.monotonic()
+    try:
+        if args.command == "export":
+            out = sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8")
+            with out:
+                count = export_jsonl(conn, out, include_votes=not args.no_votes)
+        else:
+            source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+            with source:
+                count = import_jsonl(conn, source, batch_size=args.batch_size)
+    finally:
+        conn.close()
+    logger.info(f"{args.command.capitalize()}ed {count} records in {time.monotonic() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
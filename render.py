@@ -0,0 +1,88 @@
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import VOTE, RESULTS, REACT, encode_callback
+
+
+class PollRenderer:
+    """Builds poll message text and keyboards, cached by tally version.
+
+    The title header and option buttons never change for a poll, so they
+    are built once per poll. The reaction row is rebuilt only when reaction
+    counts change. The full (text, keyboard) pair is cached per
+    (poll_id, tally version, mode), so repeated renders of an unchanged poll
+    cost a dict lookup.
+    """
+
+    def __init__(self, reactions, max_polls=2000):
+        self.reactions = reactions
+        self.max_polls = max_polls
+        self.hits = 0
+        self.misses = 0
+        self._static = OrderedDict()    # poll_id -> (header, option rows)
+        self._reaction_rows = {}        # poll_id -> (reaction counts, row)
+        self._rendered = {}             # poll_id -> {(version, mode): (text, keyboard)}
+
+    def render(self, tally, is_results_mode=False):
+        key = (tally.version, is_results_mode)
+        rendered = self._rendered.get(tally.poll_id)
+        if rendered and key in rendered:
+            self.hits += 1
+            return rendered[key]
+        self.misses += 1
+        if not rendered or next(iter(rendered))[0] != tally.version:
+            # Older versions are never asked for again
+            rendered = self._rendered[tally.poll_id] = {}
+
+        header, option_rows = self._static_parts(tally)
+        poll_text = header
+        if is_results_mode:
+            poll_text += self._counts_text(tally)
+        total_button = InlineKeyboardButton(f"Total Votes: {tally.total_votes}", callback_data=encode_callback(RESULTS, tally.poll_id))
+        keyboard = InlineKeyboardMarkup(option_rows + [self._reaction_row(tally), [total_button]])
+        rendered[key] = (poll_text, keyboard)
+        return poll_text, keyboard
+
+    def forget(self, poll_id):
+        self._static.pop(poll_id, None)
+        self._reaction_rows.pop(poll_id, None)
+        self._rendered.pop(poll_id, None)
+
+    def _static_parts(self, tally):
+        parts = self._static.get(tally.poll_id)
+        if parts is None:
+            header = f"📊 **{tally.title}**\n\n"
+            option_rows = [
+                [InlineKeyboardButton(option_text, callback_data=encode_callback(VOTE, tally.poll_id, i))]
+                for i, option_text in enumerate(tally.options)
+            ]
+            parts = self._static[tally.poll_id] = (header, option_rows)
+            while len(self._static) > self.max_polls:
+                poll_id, _ = self._static.popitem(last=False)
+                self._reaction_rows.pop(poll_id, None)
+                self._rendered.pop(poll_id, None)
+        else:
+            self._static.move_to_end(tally.poll_id)
+        return parts
+
+    def _counts_text(self, tally):
+        total_votes = tally.total_votes
+        lines = []
+        for i, option_text in enumerate(tally.options):
+            count = tally.counts.get(i, 0)
+            percentage = (count / total_votes) * 100 if total_votes > 0 else 0
+            lines.append(f"**{option_text}** - {count} votes ({percentage:.2f}%)\n")
+        return ''.join(lines)
+
+    def _reaction_row(self, tally):
+        cached = self._reaction_rows.get(tally.poll_id)
+        if cached and cached[0] == tally.reactions:
+            return cached[1]
+        row = []
+        for name, emoji in self.reactions.items():
+            count = tally.reactions.get(name, 0)
+            label = f"{emoji} {count}" if count else emoji
+            row.append(InlineKeyboardButton(label, callback_data=encode_callback(REACT, tally.poll_id, name)))
+        self._reaction_rows[tally.poll_id] = (dict(tally.reactions), row)
+        return row
@@ -0,0 +1,240 @@
+"""Shared state for running several bot workers side by side.
+
+A state backend holds what workers have to agree on: flood counters and
+python-telegram-bot's conversation state and user/chat data.
+`MemoryBackend` keeps everything in the process (a single worker, or a
+fake in tests); `RedisBackend` shares it through a Redis server. Values are strings either way, so code written
+against the fake behaves the same against Redis.
+
+Workers partition updates by chat (see `Partitioner`), so each chat is
+always handled by the same worker and its in-memory copies stay current.
+Poll traffic all goes to one worker, whose database holds every poll.
+"""
+import json
+import logging
+import time
+import zlib
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """In-process backend with the same semantics as RedisBackend."""
+
+    def __init__(self):
+        self._values = {}
+        self._hashes = {}
+        self._expires = {}
+
+    def _expired(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._values.pop(key, None)
+            del self._expires[key]
+            return True
+        return False
+
+    async def incr(self, key, ttl=None):
+        """Increment a counter, starting a `ttl` second expiry when it is created."""
+        self._expired(key)
+        value = int(self._values.get(key, 0)) + 1
+        self._values[key] = str(value)
+        if value == 1 and ttl:
+            self._expires[key] = time.monotonic() + ttl
+        return value
+
+    async def hset(self, key, field, value):
+        self._hashes.setdefault(key, {})[str(field)] = str(value)
+
+    async def hdel(self, key, field):
+        self._hashes.get(key, {}).pop(str(field), None)
+
+    async def hgetall(self, key):
+        return dict(self._hashes.get(key, {}))
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    """Backend on a Redis server, via redis-py's asyncio client."""
+
+    def __init__(self, url):
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("STATE_URL points at Redis, but the redis package isn't installed (pip install redis)")
+        self._redis = redis.asyncio.from_url(url, decode_responses=True)
+
+    async def incr(self, key, ttl=None):
+        value = await self._redis.incr(key)
+        if value == 1 and ttl:
+            await self._redis.expire(key, int(ttl))
+        return value
+
+    async def hset(self, key, field, value):
+        await self._redis.hset(key, field, value)
+
+    async def hdel(self, key, field):
+        await self._redis.hdel(key, field)
+
+    async def hgetall(self, key):
+        return await self._redis.hgetall(key)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_backend(url):
+    """Backend for a STATE_URL: memory:// or redis://, rediss://, unix://."""
+    if not url or url.startswith('memory:'):
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported STATE_URL scheme: {url.split(':', 1)[0]}")
+
+
+class BackendPersistence(BasePersistence):
+    """python-telegram-bot persistence for user data, chat data and conversations.
+
+    Data is loaded once at startup and written back every `update_interval`
+    seconds. Refreshing before each update is skipped: with updates
+    partitioned by chat, no other worker changes this worker's chats.
+    """
+
+    def __init__(self, backend, namespace='bot', update_interval=60):
+        super().__init__(store_data=PersistenceInput(bot_data=False, callback_data=False), update_interval=update_interval)
+        self.backend = backend
+        self.namespace = namespace
+
+    def _key(self, *parts):
+        return ':'.join((self.namespace,) + parts)
+
+    async def _load_ids(self, key):
+        return {int(id_): json.loads(data) for id_, data in (await self.backend.hgetall(key)).items()}
+
+    async def get_user_data(self):
+        return await self._load_ids(self._key('user_data'))
+
+    async def update_user_data(self, user_id, data):
+        await self.backend.hset(self._key('user_data'), user_id, json.dumps(data))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await self.backend.hdel(self._key('user_data'), user_id)
+
+    async def get_chat_data(self):
+        return await self._load_ids(self._key('chat_data'))
+
+    async def update_chat_data(self, chat_id, data):
+        await self.backend.hset(self._key('chat_data'), chat_id, json.dumps(data))
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        await self.backend.hdel(self._key('chat_data'), chat_id)
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def get_conversations(self, name):
+        fields = await self.backend.hgetall(self._key('conversations', name))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in fields.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        conversation_key = self._key('conversations', name)
+        if new_state is None:
+            await self.backend.hdel(conversation_key, json.dumps(list(key)))
+        else:
+            await self.backend.hset(conversation_key, json.dumps(list(key)), json.dumps(new_state))
+
+    async def flush(self):
+        pass
+
+
+class Partitioner:
+    """Assigns every update to one of several workers by chat.
+
+    `peers` lists the base URLs of all workers in the same order on every
+    worker; `index` is this worker's position in it. Updates without a chat
+    go by user instead.
+
+    Poll traffic is pinned to the worker that owns `poll_chat_id`, the
+    channel polls are posted in. That covers buttons whose data matches the
+    `poll_callbacks` regex, inline queries, private chats and `poll_commands`
+    sent in groups. Its database is then
+    the only one holding polls, votes and their statistics. Other workers
+    handle group traffic (welcomes, flood control, moderation) only.
+    """
+
+    def __init__(self, index, peers, poll_chat_id=None, poll_commands=(), poll_callbacks=None):
+        self.index = index
+        self.peers = [peer.rstrip('/') for peer in peers]
+        self.poll_chat_id = poll_chat_id
+        self.poll_commands = set(poll_commands)
+        self.poll_callbacks = poll_callbacks
+
+    @property
+    def owns_polls(self):
+        """Whether this worker handles poll traffic (always, without a poll_chat_id)."""
+        return self.poll_chat_id is None or self._owner_of(self.poll_chat_id) == self.index
+
+    def is_poll_update(self, data):
+        if 'inline_query' in data or 'chosen_inline_result' in data:
+            return True
+        if 'callback_query' in data:
+            # Other buttons (e.g. ending a chat) belong with their message's chat
+            data_field = data['callback_query'].get('data') or ''
+            return bool(self.poll_callbacks and self.poll_callbacks.match(data_field))
+        message = data.get('message') or data.get('edited_message')
+        if not message:
+            return False
+        if message.get('chat', {}).get('type') == 'private':
+            return True
+        command = (message.get('text') or '').split(maxsplit=1)[0:1]
+        return bool(command) and command[0].startswith('/') and command[0][1:].split('@')[0] in self.poll_commands
+
+    def partition_key(self, data):
+        """Chat (or user) id deciding the update's worker, or 0 if it has neither."""
+        if self.poll_chat_id is not None and self.is_poll_update(data):
+            return self.poll_chat_id
+        for field, value in data.items():
+            if not isinstance(value, dict):
+                continue
+            chat = value.get('chat') or (value.get('message') or {}).get('chat')
+            if chat and 'id' in chat:
+                return chat['id']
+            user = value.get('from')
+            if user and 'id' in user:
+                return user['id']
+        return 0
+
+    def owner(self, data):
+        """Index of the worker that handles this update."""
+        return self._owner_of(self.partition_key(data))
+
+    def _owner_of(self, key):
+        # crc32 rather than hash(): it must agree between processes
+        return zlib.crc32(str(key).encode()) % len(self.peers)
+
+    def peer_for(self, data):
+        """Base URL of the worker that owns this update, or None if it's this one."""
+        owner = self.owner(data)
+        return None if owner == self.index else self.peers[owner]
@@ -0,0 +1,435 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from metrics import Histogram
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+DB_SECONDS = Histogram('bot_db_seconds', 'Time from submitting a database call until its result is available.', ['query', 'kind'])
+
+
+def _query_name(fn):
+    # "Storage.get_poll.<locals>._get" -> "get_poll"
+    parts = fn.__qualname__.split('.')
+    return parts[1] if len(parts) > 2 and parts[0] == 'Storage' else fn.__name__
+
+
+class Storage:
+    """Async access to the bot's SQLite database.
+
+    All writes go through a single dedicated writer thread, so they are
+    serialised without blocking the event loop. Reads run on a small pool of
+    reader threads, each with its own connection (WAL lets them proceed while
+    a write is in progress). Every public method is a coroutine.
+
+    The schema is migrated by `open()`, or by the first query if nobody
+    called it, so opening can be left until the database is needed.
+    """
+
+    def __init__(self, path, readers=2):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        # chat_id -> (welcome_message, welcome_image_url) or None; only touched from the event loop
+        self._group_settings = {}
+        self._opening = None
+        self._ready = False
+
+    # --- Plumbing ---
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _run_write(self, fn, args):
+        conn = self._connection()
+        with conn:
+            return fn(conn, *args)
+
+    def _run_read(self, fn, args):
+        return fn(self._connection(), *args)
+
+    async def write(self, fn, *args):
+        """Run fn(conn, *args) in a transaction on the writer thread."""
+        if not self._ready:
+            await self.open()
+        loop = asyncio.get_running_loop()
+        with DB_SECONDS.time(query=_query_name(fn), kind='write'):
+            return await loop.run_in_executor(self._writer, partial(self._run_write, fn, args))
+
+    async def read(self, fn, *args):
+        """Run fn(conn, *args) on a reader thread."""
+        if not self._ready:
+            await self.open()
+        loop = asyncio.get_running_loop()
+        with DB_SECONDS.time(query=_query_name(fn), kind='read'):
+            return await loop.run_in_executor(self._readers, partial(self._run_read, fn, args))
+
+    async def open(self):
+        """Migrate the schema once; concurrent callers wait for the same migration."""
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._migrate())
+        await asyncio.shield(self._opening)
+
+    async def _migrate(self):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        version = await loop.run_in_executor(self._writer, lambda: migrate(self._connection()))
+        self._ready = True
+        logger.info(f"Database {self.path} ready at schema version {version} in {time.monotonic() - started:.2f}s")
+
+    async def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    # --- Polls ---
+    async def create_poll(self, poll_id, creator_id, creator_username, title, options, image_url, closes_at=None):
+        def _create(conn):
+            conn.execute(
+                "INSERT INTO polls (poll_id, creator_id, creator_username, title, image_url, closes_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (poll_id, creator_id, creator_username, title, image_url, closes_at)
+            )
+            conn.executemany("INSERT INTO options VALUES (?, ?, ?)", [(poll_id, i, text) for i, text in enumerate(options)])
+        await self.write(_create)
+
+    async def get_poll(self, poll_id):
+        """Return (title, creator_username, options, image_url), or None if the poll doesn't exist."""
+        def _get(conn):
+            poll = conn.execute("SELECT title, creator_username, image_url FROM polls WHERE poll_id = ?", (poll_id,)).fetchone()
+            if not poll:
+                return None
+            title, creator_username, image_url = poll
+            rows = conn.execute("SELECT option_text FROM options WHERE poll_id = ? ORDER BY option_index", (poll_id,))
+            return title, creator_username, [row[0] for row in rows], image_url
+        return await self.read(_get)
+
+    async def load_polls(self):
+        """Return (poll_id, creator_username, title, image_url, options, status, closes_at) for every poll."""
+        def _load(conn):
+            polls = {}
+            for poll_id, creator_username, title, image_url, status, closes_at in conn.execute(
+                    "SELECT poll_id, creator_username, title, image_url, status, closes_at FROM polls"):
+                polls[poll_id] = (poll_id, creator_username, title, image_url, [], status, closes_at)
+            for poll_id, option_text in conn.execute(
+                    "SELECT poll_id, option_text FROM options ORDER BY poll_id, option_index"):
+                if poll_id in polls:
+                    polls[poll_id][4].append(option_text)
+            return list(polls.values())
+        return await self.read(_load)
+
+    async def search_polls(self, text, limit=50, offset=0):
+        """Return (poll_id, title) of polls whose title matches every word of text, best match first."""
+        words = re.findall(r'\w+', text.lower())
+        if not words:
+            return []
+        # Quote each word and match it as a prefix, so partially typed words still match
+        match = ' '.join(f'"{word}"*' for word in words)
+
+        def _search(conn):
+            return conn.execute("""
+                SELECT polls.poll_id, polls.title FROM polls_fts
+                JOIN polls ON polls.rowid = polls_fts.rowid
+                WHERE polls_fts MATCH ?
+                ORDER BY polls_fts.rank
+                LIMIT ? OFFSET ?
+            """, (match, limit, offset)).fetchall()
+        return await self.read(_search)
+
+    # --- Votes ---
+    async def record_vote(self, poll_id, voter_id, voter_username, option_index, voted_at=None):
+        """Insert one vote. Returns False if the user had already voted in this poll."""
+        voted_at = int(time.time()) if voted_at is None else voted_at
+
+        def _record(conn):
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO votes (poll_id, voter_id, voter_username, option_index, voted_at) VALUES (?, ?, ?, ?, ?)",
+                (poll_id, voter_id, voter_username, option_index, voted_at)
+            )
+            return cur.rowcount > 0
+        return await self.write(_record)
+
+    async def record_votes(self, rows):
+        """Insert a batch of (poll_id, voter_id, voter_username, option_index, voted_at) rows in one transaction."""
+        def _record(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO votes (poll_id, voter_id, voter_username, option_index, voted_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        await self.write(_record)
+
+    async def load_votes(self):
+        """Return every (poll_id, voter_id, option_index) in insertion order."""
+        def _load(conn):
+            return conn.execute("SELECT poll_id, voter_id, option_index FROM votes ORDER BY rowid").fetchall()
+        return await self.read(_load)
+
+    async def tally(self, poll_id):
+        def _tally(conn):
+            rows = conn.execute("SELECT option_index, COUNT(*) FROM votes WHERE poll_id = ? GROUP BY option_index", (poll_id,))
+            return {option_index: count for option_index, count in rows}
+        return await self.read(_tally)
+
+    # --- Analytics ---
+    # vote_rollups and poll_stats are maintained by a trigger on votes, so
+    # these queries cost the same however many votes a poll has.
+    async def get_poll_stats(self, poll_id, hours=24):
+        """Return (title, creator_id, total_votes, first_vote_at, last_vote_at, {option_index: count},
+        [(bucket, count)] for the latest `hours` hours with votes, newest first), or None for unknown polls."""
+        def _stats(conn):
+            poll = conn.execute('''
+                SELECT polls.title, polls.creator_id, poll_stats.total_votes, poll_stats.first_vote_at, poll_stats.last_vote_at
+                FROM polls LEFT JOIN poll_stats ON poll_stats.poll_id = polls.poll_id
+                WHERE polls.poll_id = ?
+            ''', (poll_id,)).fetchone()
+            if not poll:
+                return None
+            title, creator_id, total_votes, first_vote_at, last_vote_at = poll
+            options = dict(conn.execute(
+                "SELECT option_index, SUM(count) FROM vote_rollups WHERE poll_id = ? GROUP BY option_index", (poll_id,)))
+            timeline = conn.execute(
+                "SELECT bucket, SUM(count) FROM vote_rollups WHERE poll_id = ? GROUP BY bucket ORDER BY bucket DESC LIMIT ?",
+                (poll_id, hours)).fetchall()
+            return title, creator_id, total_votes or 0, first_vote_at, last_vote_at, options, timeline
+        return await self.read(_stats)
+
+    async def top_polls(self, limit=10):
+        """Return (poll_id, title, total_votes) for the polls with the most votes."""
+        def _top(conn):
+            return conn.execute('''
+                SELECT poll_stats.poll_id, polls.title, poll_stats.total_votes
+                FROM poll_stats JOIN polls ON polls.poll_id = poll_stats.poll_id
+                ORDER BY poll_stats.total_votes DESC LIMIT ?
+            ''', (limit,)).fetchall()
+        return await self.read(_top)
+
+    # --- Lifecycle ---
+    async def get_poll_owner(self, poll_id):
+        """Return (creator_id, status), or None if the poll doesn't exist."""
+        def _get(conn):
+            return conn.execute("SELECT creator_id, status FROM polls WHERE poll_id = ?", (poll_id,)).fetchone()
+        return await self.read(_get)
+
+    async def set_poll_closes_at(self, poll_id, closes_at):
+        def _set(conn):
+            conn.execute("UPDATE polls SET closes_at = ? WHERE poll_id = ? AND status = 'open'", (closes_at, poll_id))
+        await self.write(_set)
+
+    async def close_due_polls(self, now):
+        """Close open polls whose closing time has passed. Returns their ids."""
+        def _close(conn):
+            poll_ids = [row[0] for row in conn.execute(
+                "SELECT poll_id FROM polls WHERE status = 'open' AND closes_at <= ?", (now,))]
+            conn.executemany("UPDATE polls SET status = 'closed', closed_at = ? WHERE poll_id = ?",
+                             [(now, poll_id) for poll_id in poll_ids])
+            return poll_ids
+        return await self.write(_close)
+
+    async def polls_to_archive(self, closed_before, limit=100):
+        def _find(conn):
+            return [row[0] for row in conn.execute(
+                "SELECT poll_id FROM polls WHERE status = 'closed' AND closed_at <= ? LIMIT ?", (closed_before, limit))]
+        return await self.read(_find)
+
+    async def archive_poll(self, poll_id, batch_size=5000):
+        """Freeze a closed poll's counts into poll_archive, then delete its raw votes in batches.
+
+        Each batch is its own short transaction, so votes on other polls
+        aren't held up. The summary is written first and never overwritten,
+        so an archive interrupted halfway is simply finished by the next run.
+        Returns the final per-option counts.
+        """
+        def _summarize(conn):
+            option_count = conn.execute("SELECT COUNT(*) FROM options WHERE poll_id = ?", (poll_id,)).fetchone()[0]
+            counts = [0] * option_count
+            for option_index, count in conn.execute(
+                    "SELECT option_index, COUNT(*) FROM votes WHERE poll_id = ? GROUP BY option_index", (poll_id,)):
+                if 0 <= option_index < option_count:
+                    counts[option_index] = count
+            conn.execute("INSERT OR IGNORE INTO poll_archive VALUES (?, ?, ?, ?)",
+                         (poll_id, sum(counts), json.dumps(counts), int(time.time())))
+            return json.loads(conn.execute("SELECT counts FROM poll_archive WHERE poll_id = ?", (poll_id,)).fetchone()[0])
+
+        def _delete_batch(conn):
+            return conn.execute(
+                "DELETE FROM votes WHERE rowid IN (SELECT rowid FROM votes WHERE poll_id = ? LIMIT ?)", (poll_id, batch_size)
+            ).rowcount
+
+        def _mark_archived(conn):
+            conn.execute("UPDATE polls SET status = 'archived' WHERE poll_id = ?", (poll_id,))
+
+        counts = await self.write(_summarize)
+        while await self.write(_delete_batch) == batch_size:
+            pass
+        await self.write(_mark_archived)
+        return counts
+
+    async def load_archived_counts(self):
+        """Return (poll_id, [count per option]) for every archived poll."""
+        def _load(conn):
+            return [(poll_id, json.loads(counts)) for poll_id, counts in conn.execute("SELECT poll_id, counts FROM poll_archive")]
+        return await self.read(_load)
+
+    async def incremental_vacuum(self):
+        """Return free pages to the filesystem. Returns the number of pages freed."""
+        def _vacuum(conn):
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # executescript steps the pragma to completion; execute() would free a single page
+            conn.executescript("PRAGMA incremental_vacuum")
+            # The file only shrinks once the WAL is checkpointed
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return await self.write(_vacuum)
+
+    # --- Reactions ---
+    async def set_reaction(self, poll_id, user_id, reaction):
+        """Toggle a user's reaction; a user has at most one reaction per poll.
+
+        Returns (reaction now set or None, {reaction: count} for the poll).
+        """
+        def _set(conn):
+            row = conn.execute("SELECT reaction FROM reactions WHERE poll_id = ? AND user_id = ?", (poll_id, user_id)).fetchone()
+            previous = row[0] if row else None
+            if previous:
+                conn.execute("UPDATE reaction_counts SET count = count - 1 WHERE poll_id = ? AND reaction = ?", (poll_id, previous))
+            if previous == reaction:
+                conn.execute("DELETE FROM reactions WHERE poll_id = ? AND user_id = ?", (poll_id, user_id))
+                current = None
+            else:
+                conn.execute("REPLACE INTO reactions VALUES (?, ?, ?)", (poll_id, user_id, reaction))
+                conn.execute("""
+                    INSERT INTO reaction_counts VALUES (?, ?, 1)
+                    ON CONFLICT (poll_id, reaction) DO UPDATE SET count = count + 1
+                """, (poll_id, reaction))
+                current = reaction
+            rows = conn.execute("SELECT reaction, count FROM reaction_counts WHERE poll_id = ?", (poll_id,))
+            return current, {name: count for name, count in rows}
+        return await self.write(_set)
+
+    async def load_reaction_counts(self):
+        """Return every (poll_id, reaction, count) with a positive count."""
+        def _load(conn):
+            return conn.execute("SELECT poll_id, reaction, count FROM reaction_counts WHERE count > 0").fetchall()
+        return await self.read(_load)
+
+    # --- Group settings ---
+    async def get_group_settings(self, chat_id):
+        if chat_id in self._group_settings:
+            return self._group_settings[chat_id]
+
+        def _get(conn):
+            return conn.execute("SELECT welcome_message, welcome_image_url FROM group_settings WHERE chat_id = ?", (chat_id,)).fetchone()
+        settings = await self.read(_get)
+        self._group_settings[chat_id] = settings
+        return settings
+
+    async def load_group_settings(self):
+        """Cache the settings of every group that has any."""
+        def _load(conn):
+            return conn.execute("SELECT chat_id, welcome_message, welcome_image_url FROM group_settings").fetchall()
+        for chat_id, welcome_message, welcome_image_url in await self.read(_load):
+            self._group_settings.setdefault(chat_id, (welcome_message, welcome_image_url))
+
+    async def update_group_settings(self, chat_id, welcome_message, welcome_image_url):
+        def _update(conn):
+            conn.execute("""
+                INSERT INTO group_settings (chat_id, welcome_message, welcome_image_url) VALUES (?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    welcome_message = excluded.welcome_message,
+                    welcome_image_url = excluded.welcome_image_url
+            """, (chat_id, welcome_message, welcome_image_url))
+        await self.write(_update)
+        self._group_settings.pop(chat_id, None)
+
+    async def get_flood_limits(self):
+        """Return (chat_id, threshold, window) for every group with custom flood limits."""
+        def _get(conn):
+            return conn.execute(
+                "SELECT chat_id, flood_threshold, flood_window FROM group_settings WHERE flood_threshold IS NOT NULL").fetchall()
+        return await self.read(_get)
+
+    async def set_flood_limits(self, chat_id, threshold, window):
+        def _set(conn):
+            conn.execute("""
+                INSERT INTO group_settings (chat_id, flood_threshold, flood_window) VALUES (?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    flood_threshold = excluded.flood_threshold,
+                    flood_window = excluded.flood_window
+            """, (chat_id, threshold, window))
+        await self.write(_set)
+
+    # --- Media ---
+    async def load_media_file_ids(self):
+        """Return every (source, file_id) pair."""
+        def _load(conn):
+            return conn.execute("SELECT source, file_id FROM media_cache").fetchall()
+        return await self.read(_load)
+
+    async def set_media_file_id(self, source, file_id):
+        def _set(conn):
+            conn.execute("REPLACE INTO media_cache VALUES (?, ?, ?)", (source, file_id, int(time.time())))
+        await self.write(_set)
+
+    async def delete_media_file_id(self, source):
+        def _delete(conn):
+            conn.execute("DELETE FROM media_cache WHERE source = ?", (source,))
+        await self.write(_delete)
+
+    # --- Mutes ---
+    async def add_mute(self, chat_id, user_id, duration_minutes):
+        mute_until = int(time.time()) + duration_minutes * 60
+
+        def _add(conn):
+            conn.execute("REPLACE INTO active_mutes VALUES (?, ?, ?)", (chat_id, user_id, mute_until))
+        await self.write(_add)
+        return mute_until
+
+    async def remove_mute(self, chat_id, user_id):
+        def _remove(conn):
+            conn.execute("DELETE FROM active_mutes WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+        await self.write(_remove)
+
+    async def expired_mutes(self, now, limit):
+        """Return up to limit (chat_id, user_id) pairs whose mute ended by now, oldest first."""
+        def _get(conn):
+            return conn.execute(
+                "SELECT chat_id, user_id FROM active_mutes WHERE mute_until <= ? ORDER BY mute_until LIMIT ?",
+                (now, limit)).fetchall()
+        return await self.read(_get)
+
+    async def remove_expired_mutes(self, mutes, now):
+        """Delete the given mutes unless they were extended after now."""
+        def _remove(conn):
+            conn.executemany(
+                "DELETE FROM active_mutes WHERE chat_id = ? AND user_id = ? AND mute_until <= ?",
+                [(chat_id, user_id, now) for chat_id, user_id in mutes])
+        await self.write(_remove)
+
+    async def is_user_muted(self, chat_id, user_id):
+        def _get(conn):
+            return conn.execute("SELECT mute_until FROM active_mutes WHERE chat_id = ? AND user_id = ?", (chat_id, user_id)).fetchone()
+        result = await self.read(_get)
+        if result:
+            if time.time() < result[0]:
+                return True
+            await self.remove_mute(chat_id, user_id)
+        return False
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PollTally:
+    """Poll metadata plus live option counts, the set of voters and reaction counts.
+
+    `version` increases on every change to counts, reactions or status, so
+    rendered output can be cached per version. `status` is 'open', 'closed'
+    or 'archived'; only open polls take votes, and only until `closes_at`
+    (a Unix timestamp, or None), even before the closing job has run.
+    """
+
+    __slots__ = ('poll_id', 'title', 'creator_username', 'options', 'image_url', 'counts', 'voters', 'reactions', 'status',
+                 'closes_at', 'version')
+
+    def __init__(self, poll_id, title, creator_username, options, image_url):
+        self.poll_id = poll_id
+        self.title = title
+        self.creator_username = creator_username
+        self.options = options
+        self.image_url = image_url
+        self.counts = {}
+        self.voters = set()
+        self.reactions = {}
+        self.status = 'open'
+        self.closes_at = None
+        self.version = 0
+
+    @property
+    def total_votes(self):
+        return sum(self.counts.values())
+
+    @property
+    def is_open(self):
+        return self.status == 'open' and (self.closes_at is None or time.time() < self.closes_at)
+
+
+class TallyCache:
+    """Per-poll vote tallies served from memory.
+
+    Votes are applied to the in-memory tally immediately and queued for a
+    batched INSERT into the `votes` table, which happens once `flush_size`
+    votes are pending or when `flush()` is called by the periodic job.
+
+    `load()` may run in the background after the bot starts: `ensure()`
+    waits for it before deciding that a poll doesn't exist, and raises if
+    it failed (see `load_failed()`).
+    """
+
+    def __init__(self, storage, flush_size=100):
+        self.storage = storage
+        self.flush_size = flush_size
+        self.polls = {}
+        self.pending_votes = []
+        self.loaded = asyncio.Event()
+        self.load_error = None
+
+    async def load(self):
+        """Rebuild every tally from the database."""
+        try:
+            await self._load()
+        except Exception as e:
+            self.load_failed(e)
+            raise
+        self.loaded.set()
+
+    def load_failed(self, error):
+        """Make ensure() raise instead of waiting for a load that won't happen."""
+        if not self.loaded.is_set():
+            self.load_error = error
+            self.loaded.set()
+
+    async def _load(self):
+        started = time.monotonic()
+        polls = {}
+        for poll_id, creator_username, title, image_url, options, status, closes_at in await self.storage.load_polls():
+            polls[poll_id] = PollTally(poll_id, title, creator_username, options, image_url)
+            polls[poll_id].status = status
+            polls[poll_id].closes_at = closes_at
+        for poll_id, voter_id, option_index in await self.storage.load_votes():
+            tally = polls.get(poll_id)
+            if tally is not None:
+                self._apply_vote(tally, voter_id, option_index)
+        # Archived polls have no raw votes left, only their final counts
+        for poll_id, counts in await self.storage.load_archived_counts():
+            if poll_id in polls:
+                self._set_archived(polls[poll_id], counts)
+        for poll_id, reaction, count in await self.storage.load_reaction_counts():
+            if poll_id in polls:
+                polls[poll_id].reactions[reaction] = count
+        # Keep polls created while the load was running
+        polls.update(self.polls)
+        self.polls = polls
+        logger.info(f"Loaded {len(self.polls)} poll tallies in {time.monotonic() - started:.2f}s")
+
+    def add_poll(self, poll_id, creator_username, title, options, image_url):
+        tally = PollTally(poll_id, title, creator_username, list(options), image_url)
+        self.polls[poll_id] = tally
+        return tally
+
+    async def create_poll(self, poll_id, creator_id, creator_username, title, options, image_url, closes_at=None):
+        await self.storage.create_poll(poll_id, creator_id, creator_username, title, options, image_url, closes_at)
+        tally = self.add_poll(poll_id, creator_username, title, options, image_url)
+        tally.closes_at = closes_at
+        return tally
+
+    async def set_closes_at(self, poll_id, closes_at):
+        await self.storage.set_poll_closes_at(poll_id, closes_at)
+        tally = self.polls.get(poll_id)
+        if tally is not None:
+            tally.closes_at = closes_at
+            tally.version += 1
+
+    def get(self, poll_id):
+        return self.polls.get(poll_id)
+
+    async def ensure(self, poll_id):
+        """Like get(), but waits for load() before deciding that a poll doesn't exist."""
+        tally = self.polls.get(poll_id)
+        if tally is None and not self.loaded.is_set():
+            await self.loaded.wait()
+            tally = self.polls.get(poll_id)
+        if tally is None and self.load_error:
+            raise RuntimeError(f"Poll tallies couldn't be loaded: {self.load_error}")
+        return tally
+
+    def has_voted(self, poll_id, voter_id):
+        tally = self.polls.get(poll_id)
+        return tally is not None and voter_id in tally.voters
+
+    async def record_vote(self, poll_id, voter_id, voter_username, option_index):
+        """Count a vote. Returns False if the poll is unknown or the user already voted."""
+        tally = await self.ensure(poll_id)
+        if tally is None or not tally.is_open or voter_id in tally.voters:
+            return False
+        if not 0 <= option_index < len(tally.options):
+            return False
+        self._apply_vote(tally, voter_id, option_index)
+        self.pending_votes.append((poll_id, voter_id, voter_username, option_index, int(time.time())))
+        if len(self.pending_votes) >= self.flush_size:
+            await self.flush()
+        return True
+
+    def close(self, poll_id):
+        tally = self.polls.get(poll_id)
+        if tally is not None and tally.status == 'open':
+            tally.status = 'closed'
+            tally.version += 1
+
+    def archive(self, poll_id, counts):
+        tally = self.polls.get(poll_id)
+        if tally is not None:
+            self._set_archived(tally, counts)
+
+    async def toggle_reaction(self, poll_id, user_id, reaction):
+        """Set or clear a user's reaction. Returns the reaction now set, or None."""
+        current, counts = await self.storage.set_reaction(poll_id, user_id, reaction)
+        tally = self.polls.get(poll_id)
+        if tally is not None:
+            tally.reactions = counts
+            tally.version += 1
+        return current
+
+    async def flush(self):
+        """Write all pending votes to the database in one transaction."""
+        if not self.pending_votes:
+            return 0
+        batch, self.pending_votes = self.pending_votes, []
+        try:
+            await self.storage.record_votes(batch)
+        except Exception:
+            self.pending_votes = batch + self.pending_votes
+            raise
+        return len(batch)
+
+    @staticmethod
+    def _apply_vote(tally, voter_id, option_index):
+        if voter_id in tally.voters:
+            return
+        tally.voters.add(voter_id)
+        tally.counts[option_index] = tally.counts.get(option_index, 0) + 1
+        tally.version += 1
+
+    @staticmethod
+    def _set_archived(tally, counts):
+        tally.status = 'archived'
+        tally.counts = {option_index: count for option_index, count in enumerate(counts) if count}
+        # Nobody can vote any more, so the voters aren't needed
+        tally.voters = set()
+        tally.version += 1
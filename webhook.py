@@ -0,0 +1,134 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from telegram import Update
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# Set on updates passed on by another worker, so they are never forwarded twice
+FORWARDED_HEADER = 'X-Bot-Forwarded'
+
+
+async def serve_metrics(request):
+    return web.Response(text=metrics.render(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def health_check(application):
+    async def health(request):
+        status = 200 if application.running else 503
+        return web.json_response({"running": application.running, "queued_updates": application.update_queue.qsize()}, status=status)
+    return health
+
+
+def build_web_app(application, path, secret_token=None, partitioner=None):
+    """aiohttp app that feeds POSTed updates into the application's update queue.
+
+    With a `partitioner`, updates owned by another worker are forwarded to it.
+    """
+    session = None
+
+    async def forward(peer, data):
+        nonlocal session
+        if session is None:
+            session = ClientSession(timeout=ClientTimeout(total=10))
+        headers = {FORWARDED_HEADER: '1'}
+        if secret_token:
+            headers[SECRET_HEADER] = secret_token
+        try:
+            async with session.post(peer + path, json=data, headers=headers) as response:
+                return web.Response(status=response.status)
+        except (ClientError, asyncio.TimeoutError) as e:
+            # Telegram delivers the update again later
+            logger.warning(f"Failed to forward update to {peer}: {e}")
+            return web.Response(status=502)
+
+    async def close_session(app):
+        if session is not None:
+            await session.close()
+
+    async def receive_update(request):
+        if secret_token and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret_token):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400, text="Invalid JSON")
+        if partitioner and not request.headers.get(FORWARDED_HEADER):
+            peer = partitioner.peer_for(data)
+            if peer:
+                return await forward(peer, data)
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            return web.Response(status=400, text="Invalid update")
+        await application.update_queue.put(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive_update)
+    app.router.add_get('/healthz', health_check(application))
+    app.router.add_get('/metrics', serve_metrics)
+    app.on_cleanup.append(close_session)
+    return app
+
+
+async def start_status_server(application, listen, port):
+    """Serve /healthz and /metrics on their own, for polling mode. Returns the runner to clean up."""
+    app = web.Application()
+    app.router.add_get('/healthz', health_check(application))
+    app.router.add_get('/metrics', serve_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    logger.info(f"Serving /healthz and /metrics on {listen}:{port}")
+    return runner
+
+
+async def serve_webhook(application, listen, port, path, webhook_url=None, secret_token=None, partitioner=None):
+    """Run the application behind a local aiohttp server until SIGINT/SIGTERM.
+
+    When `webhook_url` is set the webhook is registered with Telegram;
+    without it the server only accepts updates POSTed to it directly, which is
+    handy for replaying recorded updates locally.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(build_web_app(application, path, secret_token, partitioner))
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip('/') + path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+        logger.info(f"Listening for updates on {listen}:{port}{path}")
+        await stop.wait()
+    finally:
+        logger.info("Shutting down")
+        # Stop accepting updates, drain the queue, then let post_shutdown flush pending writes
+        await runner.cleanup()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application, listen, port, path, webhook_url=None, secret_token=None, partitioner=None):
+    asyncio.run(serve_webhook(application, listen, port, path, webhook_url, secret_token, partitioner))
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WelcomeBatcher:
+    """Collects members joining a chat within `window` seconds into one welcome.
+
+    The first join in a quiet chat starts the window; `send_welcome(bot,
+    chat_id, members)` is then awaited once for everyone who joined meanwhile,
+    or as soon as `max_batch` members are waiting.
+    """
+
+    def __init__(self, send_welcome, window=3.0, max_batch=30):
+        self.send_welcome = send_welcome
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._tasks = {}
+
+    def add(self, bot, chat_id, members):
+        pending = self._pending.setdefault(chat_id, (bot, []))[1]
+        pending.extend(members)
+        if len(pending) >= self.max_batch:
+            task = self._tasks.pop(chat_id, None)
+            if task:
+                task.cancel()
+            asyncio.create_task(self._flush(chat_id))
+        elif chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.create_task(self._flush_later(chat_id))
+
+    async def _flush_later(self, chat_id):
+        await asyncio.sleep(self.window)
+        self._tasks.pop(chat_id, None)
+        await self._flush(chat_id)
+
+    async def _flush(self, chat_id):
+        bot, members = self._pending.pop(chat_id, (None, None))
+        if not members:
+            return
+        try:
+            await self.send_welcome(bot, chat_id, members)
+        except Exception as e:
+            logger.error(f"Failed to welcome {len(members)} members in {chat_id}: {e}")
+
+    async def flush_all(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        await asyncio.gather(*(self._flush(chat_id) for chat_id in list(self._pending)))